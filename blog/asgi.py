@@ -2,6 +2,11 @@
 ASGI config for blog project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests under /events/ are served by the Server-Sent Events application in
+polls/events.py, everything else by Django.
+
+Set DJANGO_PRELOAD=1 when the server imports this module before forking
+its workers (gunicorn --preload) so they share the preloaded app.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -13,4 +18,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from blog.preload import preload, should_preload
+from polls.events import sse_application
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'].startswith('/events/'):
+        return await sse_application(scope, receive, send)
+    return await django_application(scope, receive, send)
+
+
+if should_preload():
+    preload()
@@ -0,0 +1,52 @@
+"""
+Preloading for forking servers (e.g. gunicorn --preload).
+
+Everything Django would otherwise import or compile on the first request of
+every worker is done once in the master process, so the forked workers share
+those pages copy-on-write instead of each building their own copy.
+
+The search suggestion index built here is a snapshot of the posts at boot;
+workers forked from it later (e.g. after max_requests) catch up with the
+posts table on their first suggestion request, and keep checking it every
+SUGGEST_SYNC_INTERVAL seconds (see polls/suggest.py).
+"""
+import gc
+import os
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template import TemplateDoesNotExist, engines
+from django.urls import get_resolver
+
+
+def preload():
+    # resolving the URLconf imports every view module
+    get_resolver().url_patterns
+
+    # compiled templates stay in the cached template loader of each engine
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, dirs, files in os.walk(directory):
+                for file_name in files:
+                    if file_name.endswith('.html'):
+                        try:
+                            engine.get_template(os.path.relpath(os.path.join(root, file_name), directory))
+                        except TemplateDoesNotExist:
+                            pass
+
+    if getattr(settings, 'PRELOAD_SUGGESTIONS', True):
+        from polls import suggest
+        try:
+            suggest.get_index()
+        except DatabaseError:
+            pass
+
+    # workers must not share the master's database connections
+    connections.close_all()
+    # keep the garbage collector from touching (and so copying) preloaded objects
+    gc.collect()
+    gc.freeze()
+
+
+def should_preload():
+    return os.environ.get('DJANGO_PRELOAD', '').lower() in ('1', 'true', 'yes')
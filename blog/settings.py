@@ -40,15 +40,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.sitemaps',
     'polls.apps.PollsConfig',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'polls.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'polls.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -121,9 +124,39 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# Where collectstatic gathers the files the web server serves in production
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 MEDIA_ROOT =  os.path.join(BASE_DIR, 'media/')
 MEDIA_URL = '/media/'
+# Media files are stored under the hash of their content (see polls/storage.py)
+DEFAULT_FILE_STORAGE = 'polls.storage.HashedMediaStorage'
+
+# Upper bound of posts kept in the in-memory search suggestion index
+SUGGEST_MAX_POSTS = 200000
+# Build the suggestion index in the master process when preloading (see blog/preload.py)
+PRELOAD_SUGGESTIONS = True
+# Seconds between checks of the posts table for changes made by other processes
+SUGGEST_SYNC_INTERVAL = 5
+
+# Seconds between batched writes of buffered page views (see polls/pageviews.py)
+PAGEVIEW_FLUSH_INTERVAL = 5
+
+# Spam probabilities at or above which comments are rejected, and below which
+# they are published, by manage.py moderate_comments (see polls/moderation.py)
+COMMENT_SPAM_THRESHOLD = 0.9
+COMMENT_HAM_THRESHOLD = 0.6
+
+# Response compression (see polls/middleware.py); Brotli is used when installed
+COMPRESSION_MIN_SIZE = 512
+# Stream the categories, search and photos listings chunk by chunk (see polls/streaming.py)
+STREAMING_LISTINGS = True
+
+# Staff users profile a request by adding ?profile or an X-Profile header
+# (see polls/profiling.py); the latest reports are kept in the admin
+PROFILING_PARAM = 'profile'
+PROFILING_HEADER = 'X-Profile'
+PROFILING_KEEP_REPORTS = 100
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
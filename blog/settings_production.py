@@ -0,0 +1,19 @@
+"""
+Production settings for blog project.
+
+Use with DJANGO_SETTINGS_MODULE=blog.settings_production. Only what a
+production worker needs is loaded: static files are served by the web
+server, so the staticfiles app and the debug context processor are dropped.
+"""
+from .settings import *  # noqa
+
+DEBUG = False
+
+ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['localhost'])
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'django.contrib.staticfiles']
+
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    processor for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+    if processor != 'django.template.context_processors.debug'
+]
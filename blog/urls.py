@@ -17,6 +17,7 @@ from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
+from polls.views import media
 
 
 urlpatterns = [
@@ -24,5 +25,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
 ]
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
+    urlpatterns += static(settings.MEDIA_URL, view=media,
                           document_root=settings.MEDIA_ROOT)
\ No newline at end of file
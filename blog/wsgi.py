@@ -3,6 +3,9 @@ WSGI config for blog project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+Set DJANGO_PRELOAD=1 when the server imports this module before forking
+its workers (gunicorn --preload) so they share the preloaded app.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 """
@@ -14,3 +17,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
 
 application = get_wsgi_application()
+
+from blog.preload import preload, should_preload
+
+if should_preload():
+    preload()
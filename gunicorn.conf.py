@@ -0,0 +1,62 @@
+"""
+gunicorn configuration for the production image: gunicorn --config gunicorn.conf.py
+
+Every value can be overridden from the environment (see docker-compose.yml).
+
+Process model: one master forking WEB_CONCURRENCY workers, by default
+2 * CPUs + 1, each running the ASGI application (blog/asgi.py) with the
+uvicorn worker: the live updates at /events/ are held open on its event
+loop, and Django's sync views run in its thread pool, so a request waiting
+on the database doesn't hold a whole process. Without the live updates,
+GUNICORN_WORKER_CLASS=gthread serves the WSGI application instead, with
+GUNICORN_THREADS threads per worker; /events/ then answers 404.
+
+The app is preloaded in the master (see blog/preload.py) and the workers
+share it copy-on-write. Workers are recycled after max_requests requests,
+with jitter so they don't all restart at once, to bound memory growth.
+
+Reloading: `kill -HUP <master>` restarts the workers gracefully with the new
+configuration, but since the app is preloaded they still run the code the
+master loaded. To deploy new code without dropping requests, send USR2 to
+start a new master next to the old one, then QUIT to the old master.
+"""
+import multiprocessing
+import os
+
+
+def cpu_count():
+    # the CPUs this container may run on, not all the CPUs of the host
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'uvicorn.workers.UvicornWorker')
+asgi = 'uvicorn' in worker_class
+
+wsgi_app = 'blog.asgi:application' if asgi else 'blog.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 * cpu_count() + 1))
+# gthread worker only
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# seconds a worker may spend on one request, and to finish its requests on
+# restart or shutdown, before it is killed
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+preload_app = True
+# read by blog/wsgi.py and blog/asgi.py while the master imports the app
+os.environ.setdefault('DJANGO_PRELOAD', '1')
+
+# heartbeat files in memory rather than on the container's overlay filesystem
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
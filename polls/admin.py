@@ -1,11 +1,44 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 
 # Register your models here.
-from .models import Post, Comment
+from .models import Post, Comment, MediaFile, Tag, PostTag, ProfileReport
+from . import tags
 
 class CommentInline(admin.TabularInline):
     model = Comment
     extra = 1
+    fields = ['user', 'body_text', 'status', 'spam_score', 'moderated_by_human']
+    readonly_fields = ['spam_score', 'moderated_by_human']
+
+
+class PostTagInline(admin.TabularInline):
+    model = PostTag
+    extra = 1
+    autocomplete_fields = ['tag']
+
+
+@admin.action(description='Add tags to selected posts')
+def add_tags(modeladmin, request, queryset):
+    if 'apply' in request.POST:
+        selected = tags.get_or_create_tags(request.POST.get('tags', '').split(','))
+        if selected:
+            created = tags.tag_posts(queryset.values_list('pk', flat=True), selected)
+            modeladmin.message_user(request, 'Added %d tag link(s).' % created, messages.SUCCESS)
+        return None
+    context = dict(
+        modeladmin.admin_site.each_context(request),
+        title='Add tags',
+        queryset=queryset,
+        opts=modeladmin.model._meta,
+        action_checkbox_name=helpers.ACTION_CHECKBOX_NAME,
+    )
+    return TemplateResponse(request, 'admin/polls/post/add_tags.html', context)
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,8 +49,130 @@ class PostAdmin(admin.ModelAdmin):
         ('Wrtie a blog post', {'fields': ['body_text']}),
         ('Upload image', {'fields': ['image_file']}),
     ]
-    inlines = [CommentInline]
+    inlines = [PostTagInline, CommentInline]
     list_display = ('title_text', 'category_text')
     search_fields = ['title_text', 'category_text']
+    actions = [add_tags]
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is Comment:
+            for comment_form in formset.forms:
+                mark_moderated(comment_form.instance, comment_form)
+        super().save_formset(request, form, formset, change)
 
 admin.site.register(Post, PostAdmin)
+
+
+def set_status(queryset, status):
+    # saved one by one so readers of the post are notified of approvals;
+    # confirming the scorer's decision makes it a human one
+    for comment in queryset.exclude(status=status, moderated_by_human=True):
+        comment.status = status
+        comment.moderated_by_human = True
+        comment.save(update_fields=['status', 'moderated_by_human'])
+
+
+def mark_moderated(comment, form):
+    if 'status' in form.changed_data and comment.status != Comment.PENDING:
+        comment.moderated_by_human = True
+
+
+@admin.action(description='Approve selected comments')
+def approve_comments(modeladmin, request, queryset):
+    set_status(queryset, Comment.APPROVED)
+
+
+@admin.action(description='Reject selected comments')
+def reject_comments(modeladmin, request, queryset):
+    set_status(queryset, Comment.REJECTED)
+
+
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('body_text', 'user', 'post', 'status', 'spam_score', 'moderated_by_human')
+    list_filter = ['status', 'moderated_by_human']
+    readonly_fields = ['moderated_by_human']
+    list_select_related = ['user', 'post']
+    search_fields = ['body_text']
+    ordering = ['status', '-spam_score']
+    actions = [approve_comments, reject_comments]
+
+    def save_model(self, request, obj, form, change):
+        mark_moderated(obj, form)
+        super().save_model(request, obj, form, change)
+
+admin.site.register(Comment, CommentAdmin)
+
+
+class MediaFileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'ref_count')
+    search_fields = ['name']
+
+admin.site.register(MediaFile, MediaFileAdmin)
+
+
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'post_count')
+    search_fields = ['name']
+    prepopulated_fields = {'slug': ('name',)}
+    readonly_fields = ['post_count']
+
+admin.site.register(Tag, TagAdmin)
+
+
+def table(headers, rows):
+    head = format_html_join('', '<th>{}</th>', ((header,) for header in headers))
+    body = format_html_join('', '<tr>{}</tr>', (
+        (format_html_join('', '<td>{}</td>', ((cell,) for cell in row)),) for row in rows))
+    return format_html('<table><thead><tr>{}</tr></thead><tbody>{}</tbody></table>', head, body)
+
+
+class ProfileReportAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'duplicate_count', 'user')
+    list_filter = ['method', 'status_code']
+    search_fields = ['path']
+    date_hierarchy = 'created_at'
+    fields = ['created_at', 'user', 'method', 'path', 'status_code', 'duration_ms', 'query_count',
+              'query_time_ms', 'duplicate_count', 'download', 'duplicate_table', 'query_table',
+              'template_table', 'profile']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        download = self.admin_site.admin_view(self.download_view)
+        return [path('<int:pk>/download/', download, name='polls_profilereport_download')] + super().get_urls()
+
+    def download_view(self, request, pk):
+        report = get_object_or_404(ProfileReport, pk=pk)
+        response = HttpResponse(bytes(report.stats_data), content_type='application/octet-stream')
+        response['Content-Disposition'] = 'attachment; filename="profile-%d.prof"' % report.pk
+        return response
+
+    @admin.display(description='cProfile data')
+    def download(self, report):
+        url = reverse('admin:polls_profilereport_download', args=(report.pk,))
+        return format_html('<a href="{}">profile-{}.prof</a> (pstats / snakeviz)', url, report.pk)
+
+    @admin.display(description='Repeated queries')
+    def duplicate_table(self, report):
+        return table(['Runs', 'Same parameters', 'SQL'],
+                     ((d['count'], d['same_params'], d['sql']) for d in report.duplicates))
+
+    @admin.display(description='Queries')
+    def query_table(self, report):
+        return table(['ms', 'Database', 'SQL', 'Parameters'],
+                     (('%.2f' % q['time_ms'], q['database'], q['sql'], q['params']) for q in report.queries))
+
+    @admin.display(description='Templates')
+    def template_table(self, report):
+        return table(['ms', 'Template'], (('%.2f' % t['time_ms'], t['template']) for t in report.templates))
+
+    @admin.display(description='Profile')
+    def profile(self, report):
+        return format_html('<pre>{}</pre>', report.stats_text)
+
+admin.site.register(ProfileReport, ProfileReportAdmin)
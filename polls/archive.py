@@ -0,0 +1,116 @@
+"""
+Monthly archive of published posts.
+
+The post count of every month, scheduled posts included, is kept in
+MonthlyPostCount: built with one TruncMonth aggregation, then refreshed month
+by month as posts change, each refresh counting a single month with a range
+scan of the pub_date index. The table doesn't depend on the time, so it is
+right in every process; scheduled posts are subtracted when the histogram is
+read, from a range scan over the future part of the same index.
+
+The histogram is cached for at most HISTOGRAM_CACHE_TIMEOUT seconds, since
+other processes don't see this one's invalidations, and no longer than until
+the next scheduled post is published.
+"""
+import datetime
+import math
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateField, Min
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import MonthlyPostCount, Post
+
+HISTOGRAM_CACHE_KEY = 'archive-histogram'
+HISTOGRAM_CACHE_TIMEOUT = 60
+SIDEBAR_MONTHS = 12
+
+
+def month_of(date):
+    """
+    Returns the first day of the month of a datetime in the current time
+    zone, the same month TruncMonth puts it in.
+    """
+    date = timezone.localtime(date)
+    return datetime.date(date.year, date.month, 1)
+
+
+def month_range(month):
+    """
+    Returns the aware datetimes starting the given month and the next one.
+    """
+    next_month = (month + datetime.timedelta(days=31)).replace(day=1)
+    return (timezone.make_aware(datetime.datetime(month.year, month.month, 1)),
+            timezone.make_aware(datetime.datetime(next_month.year, next_month.month, 1)))
+
+
+def monthly_counts(posts):
+    return (posts.annotate(month=TruncMonth('pub_date', output_field=DateField()))
+            .values('month').order_by().annotate(count=Count('id')).values_list('month', 'count'))
+
+
+def rebuild():
+    """
+    Recounts every month with a single aggregation over the posts.
+    """
+    counts = monthly_counts(Post.objects.all())
+    with transaction.atomic():
+        MonthlyPostCount.objects.all().delete()
+        MonthlyPostCount.objects.bulk_create([MonthlyPostCount(month=month, post_count=count) for month, count in counts])
+    cache.delete(HISTOGRAM_CACHE_KEY)
+
+
+def refresh_months(months):
+    """
+    Recounts the posts of the given months only.
+    """
+    for month in set(months):
+        start, end = month_range(month)
+        count = Post.objects.filter(pub_date__gte=start, pub_date__lt=end).count()
+        if count:
+            MonthlyPostCount.objects.update_or_create(month=month, defaults={'post_count': count})
+        else:
+            MonthlyPostCount.objects.filter(month=month).delete()
+    cache.delete(HISTOGRAM_CACHE_KEY)
+
+
+def histogram():
+    """
+    Returns the (month, post count) pairs of every month with published
+    posts, newest first.
+    """
+    months = cache.get(HISTOGRAM_CACHE_KEY)
+    if months is not None:
+        return months
+    now = timezone.now()
+    counts = dict(MonthlyPostCount.objects.values_list('month', 'post_count'))
+    scheduled = Post.objects.filter(pub_date__gt=now)
+    for month, count in monthly_counts(scheduled):
+        counts[month] = counts.get(month, 0) - count
+    months = sorted(((month, count) for month, count in counts.items() if count > 0), reverse=True)
+
+    timeout = HISTOGRAM_CACHE_TIMEOUT
+    next_post = scheduled.aggregate(next=Min('pub_date'))['next']
+    if next_post is not None:
+        timeout = max(1, min(timeout, math.ceil((next_post - now).total_seconds())))
+    cache.set(HISTOGRAM_CACHE_KEY, months, timeout)
+    return months
+
+
+def with_bars(months):
+    """
+    Returns the months as dicts with the `percent` width of their bar,
+    relative to the busiest of them.
+    """
+    most = max([count for month, count in months], default=0)
+    return [{'month': month, 'count': count, 'percent': round(100 * count / most)} for month, count in months]
+
+
+def sidebar(size=SIDEBAR_MONTHS):
+    return with_bars(histogram()[:size])
+
+
+def years():
+    return sorted({month.year for month, count in histogram()}, reverse=True)
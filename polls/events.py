@@ -0,0 +1,287 @@
+"""
+Server-Sent Events for new posts and comments.
+
+`sse_application` is a plain ASGI application mounted under /events/ by
+blog/asgi.py, next to Django. Each connection is a coroutine waiting on its
+own Subscription, so thousands of idle readers cost little more than their
+sockets. Sync Django code publishes through the thread-safe `hub`.
+
+The hub only reaches readers connected to the same process, while posts
+and comments are saved by any web worker, the admin or the moderate_comments
+worker. So every process with readers polls the database for them every
+EVENT_POLL_INTERVAL seconds: `comment_feed` reads approvals from the
+CommentEvent outbox, and `post_feed` reads new and newly published posts
+from the posts table itself.
+"""
+import asyncio
+import datetime
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Max, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Comment, CommentEvent, Post
+
+COALESCE_DELAY = 0.25
+HEARTBEAT_INTERVAL = 15
+MAX_PENDING = 50
+EVENT_POLL_INTERVAL = 1
+# events committed out of id order are still picked up within this many ids
+EVENT_POLL_LOOKBACK = 100
+COMMENT_EVENT_RETENTION = datetime.timedelta(days=1)
+
+POST_COMMENTS_RE = re.compile(r'^/events/posts/(?P<post_id>\d+)/comments/?$')
+
+
+class Subscription:
+    def __init__(self):
+        self.pending = []
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def put(self, message):
+        # a slow reader only ever gets the latest MAX_PENDING events
+        if len(self.pending) >= MAX_PENDING:
+            del self.pending[0]
+        self.pending.append(message)
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def drain(self):
+        messages, self.pending = self.pending, []
+        self.ready.clear()
+        return messages
+
+
+class Hub:
+    """
+    In-process publish/subscribe hub. Subscriptions live on the event loop
+    of the ASGI server; publish() may be called from any thread.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.topics = {}
+
+    def subscribe(self, topic):
+        self.loop = asyncio.get_running_loop()
+        subscription = Subscription()
+        self.topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, topic, subscription):
+        subscriptions = self.topics.get(topic)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.topics[topic]
+
+    def publish(self, topic, event, data):
+        loop = self.loop
+        if loop is None or loop.is_closed() or topic not in self.topics:
+            return
+        message = 'event: %s\ndata: %s\n\n' % (event, json.dumps(data))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._deliver(topic, message)
+        else:
+            loop.call_soon_threadsafe(self._deliver, topic, message)
+
+    def _deliver(self, topic, message):
+        for subscription in self.topics.get(topic, ()):
+            subscription.put(message)
+
+
+hub = Hub()
+
+
+class OutboxFeed:
+    """
+    Publishes to `hub` the events a subclass finds in the database, for as
+    long as anyone follows them, polling every EVENT_POLL_INTERVAL seconds
+    on the event loop and querying the database from a thread. Events are
+    told apart by id; the ids found in the last EVENT_POLL_LOOKBACK are
+    remembered, so rows committed out of id order are still published once.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.task = None
+        self.first_id = self.last_id = None
+        self.delivered = set()
+
+    def ensure_running(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+
+    def following(self):
+        raise NotImplementedError
+
+    def start(self):
+        """
+        Returns the id after which events are new.
+        """
+        raise NotImplementedError
+
+    def find(self, since):
+        """
+        Returns the (id, topic, event, data) of the events after the id
+        `since`, oldest first.
+        """
+        raise NotImplementedError
+
+    async def run(self):
+        try:
+            while self.following():
+                try:
+                    await sync_to_async(self.poll, thread_sensitive=False)()
+                except DatabaseError:
+                    pass
+                await asyncio.sleep(EVENT_POLL_INTERVAL)
+        finally:
+            # start from the newest event the next time someone follows
+            self.last_id = None
+
+    def poll(self):
+        close_old_connections()
+        try:
+            if self.last_id is None:
+                self.first_id = self.last_id = self.start()
+                self.delivered.clear()
+                return
+            # nothing from before the start is new, whatever its commit order
+            since = max(self.last_id - EVENT_POLL_LOOKBACK, self.first_id)
+            for event_id, topic, event, data in self.find(since):
+                if event_id in self.delivered:
+                    continue
+                self.hub.publish(topic, event, data)
+                self.delivered.add(event_id)
+                self.last_id = max(self.last_id, event_id)
+            self.delivered = {event_id for event_id in self.delivered if event_id > self.last_id - EVENT_POLL_LOOKBACK}
+        finally:
+            close_old_connections()
+
+
+class CommentFeed(OutboxFeed):
+    """
+    Comment approvals, read from the CommentEvent outbox, for the comment
+    topics that have readers.
+    """
+
+    def following(self):
+        return {int(topic.split(':')[1]) for topic in list(self.hub.topics) if topic.startswith('post:')}
+
+    def start(self):
+        return CommentEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+    def find(self, since):
+        events = (CommentEvent.objects.filter(id__gt=since)
+                  .filter(comment__status=Comment.APPROVED, comment__post_id__in=self.following())
+                  .select_related('comment__user').order_by('id'))
+        for event in events:
+            comment = event.comment
+            data = {'id': comment.pk, 'user': comment.user.username, 'body': comment.body_text}
+            yield event.id, 'post:%s:comments' % comment.post_id, 'comment', data
+
+
+class PostFeed(OutboxFeed):
+    """
+    New posts for the 'posts' topic. The posts table is its own outbox: a
+    post is announced once it is both saved and published, when it is
+    created with a past pub_date or when its pub_date passes.
+    """
+
+    def __init__(self, hub):
+        super().__init__(hub)
+        self.checked_at = None
+
+    def following(self):
+        return 'posts' in self.hub.topics
+
+    def start(self):
+        self.checked_at = timezone.now()
+        return Post.objects.aggregate(last=Max('id'))['last'] or 0
+
+    def find(self, since):
+        now = timezone.now()
+        posts = list(Post.objects.filter(pub_date__lte=now)
+                     .filter(Q(id__gt=since) | Q(pub_date__gt=self.checked_at))
+                     .order_by('pub_date', 'id').values('id', 'title_text', 'category_text'))
+        self.checked_at = now
+        for post in posts:
+            data = {
+                'id': post['id'],
+                'title': post['title_text'],
+                'category': post['category_text'],
+                'url': reverse('show', args=(post['id'],)),
+            }
+            yield post['id'], 'posts', 'post', data
+
+
+comment_feed = CommentFeed(hub)
+post_feed = PostFeed(hub)
+
+
+def prune_comment_events():
+    CommentEvent.objects.filter(created_at__lt=timezone.now() - COMMENT_EVENT_RETENTION).delete()
+
+
+def topic_for_path(path):
+    if path.rstrip('/') == '/events/posts':
+        return 'posts'
+    match = POST_COMMENTS_RE.match(path)
+    if match:
+        return 'post:%s:comments' % match['post_id']
+    return None
+
+
+async def sse_application(scope, receive, send):
+    topic = topic_for_path(scope['path'])
+    if topic is None or scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not Found'})
+        return
+
+    subscription = hub.subscribe(topic)
+    (post_feed if topic == 'posts' else comment_feed).ensure_running()
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        subscription.close()
+
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while not subscription.closed:
+            try:
+                await asyncio.wait_for(subscription.ready.wait(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            if subscription.closed:
+                break
+            # let a burst of events accumulate and send it as one write
+            await asyncio.sleep(COALESCE_DELAY)
+            body = ''.join(subscription.drain()).encode()
+            if body:
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        hub.unsubscribe(topic, subscription)
+        watcher.cancel()
@@ -0,0 +1,157 @@
+import functools
+import hashlib
+
+from django.contrib.sitemaps import Sitemap
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import http_date
+from django.utils.text import Truncator
+
+from .models import Post
+
+FEED_SIZE = 20
+# versions no longer requested expire instead of piling up
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_FIELDS = ('id', 'title_text', 'category_text', 'body_text', 'pub_date')
+
+
+def published_posts():
+    return Post.objects.filter(pub_date__lte=timezone.now())
+
+
+def posts_version():
+    """
+    Returns a (version, last_modified) pair that changes whenever a post is
+    added, edited, deleted or becomes published, from one aggregate query
+    over the indexed date columns.
+    """
+    now = timezone.now()
+    state = Post.objects.aggregate(
+        count=Count('id'),
+        updated=Max('updated_at'),
+        published=Max('pub_date', filter=Q(pub_date__lte=now)),
+    )
+    version = '%(count)s-%(updated)s-%(published)s' % state
+    dates = [date for date in (state['updated'], state['published']) if date is not None]
+    return hashlib.md5(version.encode()).hexdigest(), max(dates) if dates else None
+
+
+def cached_by_posts_version(view):
+    """
+    Serves the view from the cache until the posts change, and answers
+    conditional GETs with 304 Not Modified without rendering anything.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        version, last_modified = posts_version()
+        etag = '"%s"' % version
+        timestamp = last_modified.timestamp() if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            return response
+
+        # the links are absolute, built from the scheme and host of the request;
+        # the query string is left out but for the sitemap's page, so that
+        # made-up parameters can't add entries
+        key = 'posts-feed:%s:%s:%s:%s:%s' % (
+            request.scheme, request.get_host(), request.path, request.GET.get('p', ''), version)
+        cached = cache.get(key)
+        if cached is None:
+            rendered = view(request, *args, **kwargs)
+            if hasattr(rendered, 'render'):
+                rendered.render()
+            if rendered.status_code != 200:
+                return rendered
+            cached = (rendered.content, rendered['Content-Type'])
+            cache.set(key, cached, FEED_CACHE_TIMEOUT)
+        response = HttpResponse(cached[0], content_type=cached[1])
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+    return wrapper
+
+
+class LatestPostsFeed(Feed):
+    title = 'FUN animals'
+    link = '/'
+    description = 'Latest posts from FUN animals'
+
+    def items(self):
+        return published_posts().order_by('-pub_date').values(*FEED_FIELDS)[:FEED_SIZE]
+
+    def item_title(self, item):
+        return item['title_text']
+
+    def item_description(self, item):
+        return Truncator(item['body_text']).words(100)
+
+    def item_link(self, item):
+        return reverse('show', args=(item['id'],))
+
+    def item_pubdate(self, item):
+        return item['pub_date']
+
+    def item_categories(self, item):
+        return [item['category_text']]
+
+
+class LatestPostsAtomFeed(LatestPostsFeed):
+    feed_type = Atom1Feed
+    subtitle = LatestPostsFeed.description
+
+
+class CategoryFeed(LatestPostsFeed):
+    def get_object(self, request, category):
+        return category
+
+    def title(self, category):
+        return 'FUN animals - %s' % category
+
+    def link(self, category):
+        return reverse('categories', args=(category,))
+
+    def description(self, category):
+        return 'Latest posts in %s' % category
+
+    def items(self, category):
+        return published_posts().filter(category_text=category).order_by('-pub_date').values(*FEED_FIELDS)[:FEED_SIZE]
+
+
+class CategoryAtomFeed(CategoryFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, category):
+        return self.description(category)
+
+
+class PostSitemap(Sitemap):
+    changefreq = 'weekly'
+
+    def items(self):
+        return published_posts().order_by('id').values('id', 'updated_at')
+
+    def location(self, item):
+        return reverse('show', args=(item['id'],))
+
+    def lastmod(self, item):
+        return item['updated_at']
+
+
+class PagesSitemap(Sitemap):
+    changefreq = 'daily'
+
+    def items(self):
+        return ['index', 'photos', 'info']
+
+    def location(self, item):
+        return reverse(item)
+
+
+sitemaps = {'posts': PostSitemap, 'pages': PagesSitemap}
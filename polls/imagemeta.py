@@ -0,0 +1,65 @@
+import base64
+import functools
+import io
+
+from .models import DEFAULT_IMAGE
+from .storage import is_hashed_name
+
+PLACEHOLDER_SIZE = 16
+METADATA_FIELDS = ('image_width', 'image_height', 'image_color', 'image_placeholder')
+
+
+def image_metadata(file):
+    """
+    Returns the width, height, dominant colour (as #rrggbb) and a tiny
+    blurred JPEG placeholder (as a data URI) of an image file.
+    """
+    # Pillow is only needed when an image is uploaded or backfilled
+    from PIL import Image, ImageFilter
+
+    with Image.open(file) as image:
+        width, height = image.size
+        # JPEGs can be decoded at a fraction of their size, which is all we need
+        image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        image = image.convert('RGB')
+        red, green, blue = image.resize((1, 1), Image.BOX).getpixel((0, 0))
+        image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        image = image.filter(ImageFilter.GaussianBlur(1))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=40)
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_color': '#%02x%02x%02x' % (red, green, blue),
+        'image_placeholder': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode(),
+    }
+
+
+def read_metadata(field_file):
+    """
+    Reads the metadata of a (possibly not yet saved) FieldFile, or returns
+    None if it is missing or not an image.
+    """
+    try:
+        if field_file._committed:
+            if field_file.name == DEFAULT_IMAGE or is_hashed_name(field_file.name):
+                return stored_metadata(field_file.storage, field_file.name)
+            with field_file.storage.open(field_file.name, 'rb') as file:
+                return image_metadata(file)
+        field_file.file.seek(0)
+        try:
+            return image_metadata(field_file.file)
+        finally:
+            field_file.file.seek(0)
+    except (OSError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=256)
+def stored_metadata(storage, name):
+    """
+    Metadata of a stored file that never changes (content-addressed or the
+    shared default image), read once per process.
+    """
+    with storage.open(name, 'rb') as file:
+        return image_metadata(file)
@@ -0,0 +1,32 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from polls.imagemeta import image_metadata
+from polls.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Compute image size, dominant colour and placeholder for posts that are missing them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute the metadata of every post, not only the missing ones.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.all()
+        if not options['all']:
+            posts = posts.filter(image_width__isnull=True)
+        # posts sharing an image are updated together, so each file is read once
+        names = posts.exclude(image_file='').values_list('image_file', flat=True).distinct()
+
+        updated = failed = 0
+        for name in names:
+            try:
+                with default_storage.open(name, 'rb') as file:
+                    metadata = image_metadata(file)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write('%s: %s' % (name, error))
+                continue
+            updated += Post.objects.filter(image_file=name).update(**metadata)
+        self.stdout.write(self.style.SUCCESS('Updated %d post(s), %d image(s) could not be read' % (updated, failed)))
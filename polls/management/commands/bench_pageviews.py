@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from polls import pageviews
+from polls.models import Post
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class Command(BaseCommand):
+    help = ('Request a post page repeatedly and count the database writes caused by page view tracking. '
+            'Runs against the configured database in a transaction that is rolled back, '
+            'so the views it records are not kept.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--post', type=int, help='Post id to request, defaults to the latest published post.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(pub_date__lte=timezone.now())
+        post = posts.filter(pk=options['post']).first() if options['post'] else posts.order_by('-pub_date').first()
+        if post is None:
+            raise CommandError('No published post to request.')
+
+        url = reverse('show', args=(post.pk,))
+        client = Client()
+        # the views are counted in the configured database, so they are rolled
+        # back rather than added to the post's stats
+        with transaction.atomic():
+            # run the whole benchmark inside a single flush interval
+            pageviews.counter.flush()
+            pageviews.counter.interval = float('inf')
+            with override_settings(ALLOWED_HOSTS=['testserver']), CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for i in range(options['requests']):
+                    client.get(url)
+                elapsed = time.perf_counter() - started
+                during = len(queries)
+                pageviews.counter.flush()
+            transaction.set_rollback(True)
+
+        writes = [query for query in queries[:during] if query['sql'].lstrip().upper().startswith(WRITE_STATEMENTS)]
+        flush = [query['sql'] for query in queries[during:]]
+        self.stdout.write('%d requests to %s in %.2f s (%.0f req/s)' % (
+            options['requests'], url, elapsed, options['requests'] / elapsed))
+        self.stdout.write('queries per request: %.1f, writes during requests: %d' % (
+            during / options['requests'], len(writes)))
+        self.stdout.write('statements to flush all %d views: %d' % (options['requests'], len(flush)))
+        for sql in flush:
+            self.stdout.write('  ' + sql[:120])
@@ -0,0 +1,108 @@
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from polls.models import Post
+
+HOST = '127.0.0.1'
+
+
+def get(port, path):
+    """
+    Requests `path` on a new connection and returns (status, seconds).
+    """
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection(HOST, port, timeout=30)
+    try:
+        connection.request('GET', path, headers={'Host': 'localhost'})
+        response = connection.getresponse()
+        response.read()
+        status = response.status
+    except (OSError, http.client.HTTPException):
+        status = None
+    finally:
+        connection.close()
+    return status, time.perf_counter() - started
+
+
+def wait_until_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = ('Start the development server and gunicorn (configured by gunicorn.conf.py) side by side '
+            'and compare their throughput and latency on the index and post pages under concurrent load.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per page and server.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--workers', type=int, help='gunicorn workers, defaults to the gunicorn.conf.py sizing.')
+        parser.add_argument('--port', type=int, default=8610, help='First of the two ports to listen on.')
+
+    def handle(self, *args, **options):
+        post = Post.objects.filter(pub_date__lte=timezone.now()).order_by('-pub_date').first()
+        if post is None:
+            raise CommandError('No published post to request.')
+        paths = [('index', reverse('index')), ('show', reverse('show', args=(post.pk,)))]
+
+        env = dict(os.environ, GUNICORN_ACCESS_LOG='')
+        if options['workers']:
+            env['WEB_CONCURRENCY'] = str(options['workers'])
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        config = os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+        servers = [
+            ('runserver', options['port'],
+             [sys.executable, manage, 'runserver', '--noreload', '%s:%d' % (HOST, options['port'])]),
+            ('gunicorn', options['port'] + 1,
+             [sys.executable, '-m', 'gunicorn', '--config', config, '--bind', '%s:%d' % (HOST, options['port'] + 1)]),
+        ]
+
+        self.stdout.write('%d requests per page, %d concurrent clients' % (options['requests'], options['concurrency']))
+        self.stdout.write('%-10s %-6s %8s %9s %9s %9s %7s' % ('server', 'page', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+        for name, port, command in servers:
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if not wait_until_ready(port, process):
+                    raise CommandError('%s did not start: %s' % (name, ' '.join(command)))
+                for label, path in paths:
+                    self.run(name, port, label, path, options['requests'], options['concurrency'])
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=40)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    def run(self, name, port, label, path, requests, concurrency):
+        with ThreadPoolExecutor(concurrency) as pool:
+            # warm up every worker before measuring
+            list(pool.map(lambda i: get(port, path), range(concurrency * 4)))
+            started = time.perf_counter()
+            results = list(pool.map(lambda i: get(port, path), range(requests)))
+            elapsed = time.perf_counter() - started
+
+        times = sorted(seconds * 1000 for status, seconds in results)
+        percentiles = statistics.quantiles(times, n=100)
+        errors = sum(status != 200 for status, seconds in results)
+        self.stdout.write('%-10s %-6s %8.0f %9.1f %9.1f %9.1f %7d' % (
+            name, label, requests / elapsed, percentiles[49], percentiles[94], percentiles[98], errors))
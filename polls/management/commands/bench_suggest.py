@@ -0,0 +1,60 @@
+import random
+import statistics
+import string
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from polls.suggest import PrefixIndex
+
+WORDS = ['tiger', 'shark', 'cat', 'dog', 'parrot', 'whale', 'otter', 'lion', 'zebra', 'gecko',
+         'funny', 'sleepy', 'giant', 'baby', 'wild', 'ocean', 'forest', 'desert', 'night', 'river']
+
+
+class Command(BaseCommand):
+    help = 'Measure per-keystroke latency of the search suggestion index on synthetic posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        posts = []
+        for post_id in range(1, options['posts'] + 1):
+            title = ' '.join(rng.choice(WORDS) for i in range(rng.randint(1, 4)))
+            title += ' ' + ''.join(rng.choice(string.ascii_lowercase) for i in range(6))
+            category = rng.choice(WORDS) + ' ' + str(post_id % 500)
+            posts.append((post_id, title[:40], category, now - timedelta(minutes=post_id)))
+        posts.reverse()
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        index = PrefixIndex(options['posts'])
+        index.build(posts)
+        build_time = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # every query is one keystroke: a prefix of 1-8 characters of a title
+        prefixes = []
+        for i in range(options['queries']):
+            title = rng.choice(posts)[1]
+            prefixes.append(title[:rng.randint(1, 8)])
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            index.search(prefix, now=now)
+            timings.append((time.perf_counter() - started) * 1e6)
+        timings.sort()
+
+        self.stdout.write('posts: %d, index keys: %d' % (options['posts'], len(index.keys)))
+        self.stdout.write('build: %.2f s, memory: %.1f MB' % (build_time, memory / 2 ** 20))
+        self.stdout.write('per keystroke: mean %.1f us, p50 %.1f us, p95 %.1f us, p99 %.1f us, max %.1f us' % (
+            statistics.mean(timings), timings[len(timings) // 2], timings[int(len(timings) * 0.95)],
+            timings[int(len(timings) * 0.99)], timings[-1]))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from polls import related
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the related posts index from the TF-IDF similarity of all posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', type=int, default=related.TOP_K,
+                            help='Number of related posts stored per post.')
+
+    def handle(self, *args, **options):
+        count = related.rebuild_index(k=options['k'])
+        self.stdout.write(self.style.SUCCESS('Stored %d related post links' % count))
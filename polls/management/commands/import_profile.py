@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+STARTUP_CODE = """
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+import {application}
+"""
+
+
+class Command(BaseCommand):
+    help = 'Report the modules that take the longest to import when a worker starts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25,
+                            help='Number of modules to list.')
+        parser.add_argument('--application', default='blog.wsgi',
+                            help='Entry point module imported by the worker.')
+        parser.add_argument('--self', action='store_true', dest='self_time',
+                            help='Sort by time spent in the module itself instead of cumulative time.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_PRELOAD='')
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'blog.settings')
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_CODE.format(application=options['application'])],
+            env=env, capture_output=True, text=True,
+        )
+        if process.returncode != 0:
+            raise CommandError(process.stderr.strip().splitlines()[-1])
+
+        modules = []
+        for line in process.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            modules.append((int(self_us), int(cumulative_us), name.rstrip()))
+
+        total = sum(self_us for self_us, cumulative_us, name in modules)
+        key = 0 if options['self_time'] else 1
+        self.stdout.write('%d modules imported in %.1f ms (%s)' % (
+            len(modules), total / 1000, env['DJANGO_SETTINGS_MODULE']))
+        self.stdout.write('%10s %12s  module' % ('self ms', 'cumulative'))
+        for module in sorted(modules, key=lambda module: module[key], reverse=True)[:options['limit']]:
+            self.stdout.write('%10.1f %12.1f  %s' % (module[0] / 1000, module[1] / 1000, module[2]))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from polls.events import prune_comment_events
+from polls.moderation import moderate_batch, train_scorer
+
+
+class Command(BaseCommand):
+    help = 'Score pending comments for spam in batches, publishing ham and rejecting spam.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll the queue for new comments.')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds to wait for new comments when the queue is empty.')
+
+    def handle(self, *args, **options):
+        scorer = train_scorer()
+        while True:
+            scored, approved, rejected = moderate_batch(scorer, options['batch_size'])
+            if scored:
+                self.stdout.write('Scored %d comment(s): %d approved, %d rejected, %d left for review' % (
+                    scored, approved, rejected, scored - approved - rejected))
+            if scored == options['batch_size']:
+                continue
+            prune_comment_events()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+            # pick up decisions moderators made in the meantime
+            scorer = train_scorer()
@@ -0,0 +1,69 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from polls.models import MediaFile, Post
+from polls.storage import is_hashed_name
+
+
+class Command(BaseCommand):
+    help = 'Delete stored media files that are no longer referenced by any post.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true',
+                            help='Rebuild reference counts from the posts table before sweeping.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the files that would be deleted.')
+        parser.add_argument('--directory', default='photos',
+                            help='Media directory to scan for untracked files.')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.recount()
+
+        referenced = set(Post.objects.values_list('image_file', flat=True).distinct())
+        orphans = set(MediaFile.objects.filter(ref_count=0).values_list('name', flat=True))
+        if default_storage.exists(options['directory']):
+            for file_name in default_storage.listdir(options['directory'])[1]:
+                name = '%s/%s' % (options['directory'], file_name)
+                if is_hashed_name(name) and name not in referenced:
+                    orphans.add(name)
+        # only content-addressed uploads are swept, never shared files like DEFAULT_IMAGE
+        orphans = {name for name in orphans - referenced if is_hashed_name(name)}
+
+        deleted = 0
+        for name in sorted(orphans):
+            if options['dry_run']:
+                self.stdout.write(name)
+            elif self.delete(name):
+                self.stdout.write(name)
+                deleted += 1
+        self.stdout.write(self.style.SUCCESS('%d orphaned file(s) %s' % (
+            len(orphans) if options['dry_run'] else deleted, 'found' if options['dry_run'] else 'deleted')))
+
+    def delete(self, name):
+        """
+        Deletes a file unless a post started using it since the sweep began:
+        an upload with the same content reuses the existing file, so the
+        reference count is checked again with its row locked.
+        """
+        with transaction.atomic():
+            media = MediaFile.objects.select_for_update().filter(name=name).first()
+            if media is not None and media.ref_count > 0 or Post.objects.filter(image_file=name).exists():
+                return False
+            default_storage.delete(name)
+            if media is not None:
+                media.delete()
+        return True
+
+    def recount(self):
+        counts = dict(Post.objects.values_list('image_file').annotate(count=Count('id')))
+        MediaFile.objects.exclude(name__in=counts).update(ref_count=0)
+        existing = list(MediaFile.objects.filter(name__in=counts))
+        for media in existing:
+            media.ref_count = counts[media.name]
+        MediaFile.objects.bulk_update(existing, ['ref_count'])
+        known = {media.name for media in existing}
+        MediaFile.objects.bulk_create(
+            [MediaFile(name=name, ref_count=count) for name, count in counts.items() if name not in known])
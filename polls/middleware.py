@@ -0,0 +1,118 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from . import profiling
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_CONTENT_TYPES = [
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/javascript',
+    'application/javascript', 'application/json', 'application/xml',
+    'application/rss+xml', 'application/atom+xml', 'image/svg+xml',
+]
+
+re_accept_encoding = re.compile(r'\s*([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?', re.I)
+
+
+def accepted_encodings(header):
+    """
+    Returns the content codings of an Accept-Encoding header that aren't
+    refused with q=0.
+    """
+    accepted = set()
+    for part in header.split(','):
+        match = re_accept_encoding.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match[2]) if match[2] else 1
+        except ValueError:
+            continue
+        if quality > 0:
+            accepted.add(match[1].lower())
+    return accepted
+
+
+def brotli_sequence(sequence, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        # flush after every chunk so the client gets it right away
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with Brotli when the client accepts it (and the
+    brotli package is installed), otherwise with gzip. Only content types in
+    COMPRESSION_CONTENT_TYPES and bodies of at least COMPRESSION_MIN_SIZE
+    bytes are compressed; streamed responses are compressed chunk by chunk.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in getattr(settings, 'COMPRESSION_CONTENT_TYPES', DEFAULT_CONTENT_TYPES):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 512):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                quality = getattr(settings, 'COMPRESSION_BROTLI_STREAMING_QUALITY', 4)
+                response.streaming_content = brotli_sequence(response.streaming_content, quality)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5))
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(response.content))
+
+        # the compressed body is not byte-for-byte what a strong ETag promised
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile the request when a staff user asks for it with the PROFILING_PARAM
+    query parameter or the PROFILING_HEADER header (see polls/profiling.py).
+    Must come after AuthenticationMiddleware. Other requests only pay for
+    the check of the query string and headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if profiling.requested(request) and request.user.is_staff:
+            return profiling.profile_request(request, self.get_response)
+        return self.get_response(request)
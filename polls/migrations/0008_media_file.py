@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_media_references(apps, schema_editor):
+    Post = apps.get_model('polls', 'Post')
+    MediaFile = apps.get_model('polls', 'MediaFile')
+    Post.objects.filter(image_file='/media/photos/Tiger_shark.jpg').update(image_file='photos/Tiger_shark.jpg')
+    counts = Post.objects.values_list('image_file').annotate(count=Count('id'))
+    MediaFile.objects.bulk_create([MediaFile(name=name, ref_count=count) for name, count in counts if name])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0007_rename_user_id_comment_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image_file',
+            field=models.ImageField(default='photos/Tiger_shark.jpg', upload_to='photos'),
+        ),
+        migrations.RunPython(count_media_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0010_post_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='poststats',
+            index=models.Index(fields=['day', 'post'], name='polls_posts_day_ac341d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='poststats',
+            unique_together={('post', 'day')},
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:56
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_user_comments(apps, schema_editor):
+    Comment = apps.get_model('polls', 'Comment')
+    UserStats = apps.get_model('polls', 'UserStats')
+    counts = (Comment.objects.filter(status='approved').values('user').order_by()
+              .annotate(comments=Count('id'), posts=Count('post', distinct=True))
+              .values_list('user', 'comments', 'posts'))
+    UserStats.objects.bulk_create([
+        UserStats(user_id=user_id, comment_count=comments, posts_commented=posts)
+        for user_id, comments, posts in counts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('polls', '0014_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='auth.user')),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+                ('posts_commented', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['user', 'status', 'id'], name='polls_comme_user_id_375408_idx'),
+        ),
+        migrations.RunPython(count_user_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:58
+
+from django.db import migrations, models
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def count_monthly_posts(apps, schema_editor):
+    Post = apps.get_model('polls', 'Post')
+    MonthlyPostCount = apps.get_model('polls', 'MonthlyPostCount')
+    counts = (Post.objects.filter(pub_date__lte=timezone.now())
+              .annotate(month=TruncMonth('pub_date', output_field=DateField()))
+              .values('month').order_by().annotate(count=Count('id')).values_list('month', 'count'))
+    MonthlyPostCount.objects.bulk_create([MonthlyPostCount(month=month, post_count=count) for month, count in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0015_user_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyPostCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('post_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_monthly_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:24
+
+from django.db import migrations
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+
+def count_monthly_posts(apps, schema_editor):
+    # scheduled posts are now counted too, and subtracted when read
+    Post = apps.get_model('polls', 'Post')
+    MonthlyPostCount = apps.get_model('polls', 'MonthlyPostCount')
+    counts = (Post.objects.annotate(month=TruncMonth('pub_date', output_field=DateField()))
+              .values('month').order_by().annotate(count=Count('id')).values_list('month', 'count'))
+    MonthlyPostCount.objects.all().delete()
+    MonthlyPostCount.objects.bulk_create([MonthlyPostCount(month=month, post_count=count) for month, count in counts])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0017_profile_report'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_monthly_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0019_related_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='polls.comment')),
+            ],
+        ),
+    ]
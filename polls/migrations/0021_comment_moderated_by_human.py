@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-19 20:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0020_comment_events'),
+    ]
+
+    operations = [
+        # earlier decisions can't be told from the scorer's or from those of
+        # migration 0013, so none of them is counted as human
+        migrations.AddField(
+            model_name='comment',
+            name='moderated_by_human',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['moderated_by_human', 'id'], name='polls_comme_moderat_03cde5_idx'),
+        ),
+    ]
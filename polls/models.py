@@ -5,12 +5,21 @@ from django.utils import timezone
 from django.contrib.auth.models import User
 
 # Create your models here.
+DEFAULT_IMAGE = 'photos/Tiger_shark.jpg'
+
 class Post(models.Model):
     title_text = models.CharField(max_length=40)
     category_text = models.CharField(max_length=50)
-    pub_date = models.DateTimeField('date published')
+    pub_date = models.DateTimeField('date published', db_index=True)
     body_text = models.TextField()
-    image_file = models.ImageField(upload_to = 'photos', default='/media/photos/Tiger_shark.jpg')
+    image_file = models.ImageField(upload_to = 'photos', default=DEFAULT_IMAGE)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # filled from the image by polls/imagemeta.py so pages can reserve space before it loads
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, blank=True, editable=False)
+    image_placeholder = models.TextField(blank=True, editable=False)
+    tags = models.ManyToManyField('Tag', through='PostTag', related_name='posts', blank=True)
     def __str__(self):
         return self.title_text
     
@@ -19,8 +28,179 @@ class Post(models.Model):
 
 
 class Comment(models.Model):
+    PENDING = 'pending'
+    APPROVED = 'approved'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (APPROVED, 'Approved'),
+        (REJECTED, 'Rejected'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     body_text = models.TextField(max_length=200)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    spam_score = models.FloatField(null=True, blank=True)
+    # approved or rejected by a moderator, not by the spam scorer, which
+    # only learns from these (see polls/moderation.py)
+    moderated_by_human = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'status']),
+            models.Index(fields=['status', 'spam_score']),
+            # latest human decisions, to train the spam scorer on
+            models.Index(fields=['moderated_by_human', 'id']),
+            # keyset pagination of a user's comments on their profile page
+            models.Index(fields=['user', 'status', 'id']),
+        ]
     def __str__(self):
         return self.body_text
+
+
+class CommentEvent(models.Model):
+    """
+    Outbox of comment approvals, whichever process made them, read by the
+    live comment streams of every server process (see polls/events.py).
+    """
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    def __str__(self):
+        return str(self.comment_id)
+
+
+class UserStats(models.Model):
+    """
+    Published comments of a user, kept up to date as comments are approved,
+    rejected or deleted (see polls/profiles.py).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    comment_count = models.PositiveIntegerField(default=0)
+    posts_commented = models.PositiveIntegerField(default=0)
+    def __str__(self):
+        return '%s: %s' % (self.user_id, self.comment_count)
+
+
+class MonthlyPostCount(models.Model):
+    """
+    Posts per month, scheduled ones included, from which polls/archive.py
+    builds the archive histogram.
+    """
+    month = models.DateField(unique=True)
+    post_count = models.PositiveIntegerField(default=0)
+    def __str__(self):
+        return '%s: %s' % (self.month, self.post_count)
+
+
+class MediaFile(models.Model):
+    """
+    Reference count of the posts using a stored media file, so files that
+    are no longer used can be swept.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    def __str__(self):
+        return self.name
+
+
+class RelatedPost(models.Model):
+    """
+    Precomputed nearest neighbours of a post, ranked by TF-IDF cosine
+    similarity (see polls/related.py).
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['post', 'rank'])]
+    def __str__(self):
+        return '%s -> %s' % (self.post_id, self.related_id)
+
+
+class RelatedTerm(models.Model):
+    """
+    Vocabulary of the last full build of the related posts index, the
+    column and inverse document frequency of each term.
+    """
+    term = models.CharField(max_length=100, unique=True)
+    column = models.PositiveIntegerField()
+    idf = models.FloatField()
+    def __str__(self):
+        return self.term
+
+
+class PostVector(models.Model):
+    """
+    TF-IDF vector of a post over the RelatedTerm vocabulary, stored as its
+    non-zero columns and weights (see polls/related.py).
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    data = models.BinaryField()
+    def __str__(self):
+        return str(self.post_id)
+
+
+class PostStats(models.Model):
+    """
+    Page views of a post per day, written in batches by polls/pageviews.py.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('post', 'day')]
+        indexes = [models.Index(fields=['day', 'post'])]
+    def __str__(self):
+        return '%s %s: %s' % (self.post_id, self.day, self.views)
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    slug = models.SlugField(max_length=50, unique=True)
+    # number of posts with this tag, kept up to date by polls/tags.py
+    post_count = models.PositiveIntegerField(default=0, db_index=True)
+    def __str__(self):
+        return self.name
+
+
+class PostTag(models.Model):
+    """
+    Inverted index from tags to posts; the (tag, post) unique index answers
+    tag lookups and intersections without touching the posts table.
+    """
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = [('tag', 'post')]
+    def __str__(self):
+        return '%s: %s' % (self.tag_id, self.post_id)
+
+
+class ProfileReport(models.Model):
+    """
+    Profile of one request captured on demand by a staff user (see
+    polls/profiling.py).
+    """
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_time_ms = models.FloatField()
+    # queries repeated with the same SQL and parameters, beyond their first run
+    duplicate_count = models.PositiveIntegerField()
+    queries = models.JSONField(default=list)
+    duplicates = models.JSONField(default=list)
+    templates = models.JSONField(default=list)
+    stats_text = models.TextField()
+    # marshalled pstats data, loadable with pstats.Stats or snakeviz
+    stats_data = models.BinaryField()
+    def __str__(self):
+        return '%s %s' % (self.method, self.path)
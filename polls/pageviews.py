@@ -0,0 +1,112 @@
+import atexit
+import datetime
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import Post, PostStats
+
+POPULAR_CACHE_KEY = 'popular-posts:%d'
+POPULAR_CACHE_TIMEOUT = 60
+# (post, day) pairs per statement, keeping the CASE and OR expressions well
+# below SQLite's expression depth limit of 1000
+WRITE_CHUNK_SIZE = 200
+
+
+class ViewCounter:
+    """
+    Per-process page view counter. Views are counted in memory and written
+    as aggregated deltas at most once every `interval` seconds: one INSERT
+    for (post, day) rows this process hasn't seen yet and one UPDATE for the
+    deltas of up to WRITE_CHUNK_SIZE pairs, however many views there were.
+    Views that couldn't be written are kept for the next flush.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.known = set()
+        self.last_flush = time.monotonic()
+
+    def record(self, post_id):
+        now = time.monotonic()
+        with self.lock:
+            self.counts[(post_id, timezone.localdate())] += 1
+            if now - self.last_flush < self.interval:
+                return
+        try:
+            self.flush()
+        except DatabaseError:
+            # the views are kept, and recording one must not fail the page
+            pass
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.last_flush = time.monotonic()
+        items = list(counts.items())
+        for start in range(0, len(items), WRITE_CHUNK_SIZE):
+            try:
+                self.write(dict(items[start:start + WRITE_CHUNK_SIZE]))
+            except DatabaseError:
+                with self.lock:
+                    self.counts.update(dict(items[start:]))
+                raise
+
+    def write(self, counts):
+        missing = [key for key in counts if key not in self.known]
+        if missing:
+            if len(self.known) > 10000:
+                self.known.clear()
+            PostStats.objects.bulk_create(
+                [PostStats(post_id=post_id, day=day) for post_id, day in missing], ignore_conflicts=True)
+            self.known.update(missing)
+        keys = Q()
+        deltas = []
+        for (post_id, day), views in counts.items():
+            keys |= Q(post_id=post_id, day=day)
+            deltas.append(When(post_id=post_id, day=day, then=Value(views)))
+        PostStats.objects.filter(keys).update(views=F('views') + Case(*deltas, default=Value(0)))
+
+
+counter = ViewCounter(getattr(settings, 'PAGEVIEW_FLUSH_INTERVAL', 5))
+
+
+@atexit.register
+def flush_at_exit():
+    try:
+        counter.flush()
+    except DatabaseError:
+        pass
+
+
+def popular_posts(days=7, limit=5):
+    """
+    Returns the published posts with the most views over the last `days`
+    days, recomputed from the daily buckets at most once a minute.
+    """
+    key = POPULAR_CACHE_KEY % days
+    ranking = cache.get(key)
+    if ranking is None:
+        since = timezone.localdate() - datetime.timedelta(days=days - 1)
+        ranking = list(
+            PostStats.objects.filter(day__gte=since, post__pub_date__lte=timezone.now())
+            .values('post').annotate(total=Sum('views')).order_by('-total', '-post')
+            .values_list('post', 'total')[:50]
+        )
+        cache.set(key, ranking, POPULAR_CACHE_TIMEOUT)
+    ranking = ranking[:limit]
+    posts = Post.objects.in_bulk([post_id for post_id, total in ranking])
+    result = []
+    for post_id, total in ranking:
+        if post_id in posts:
+            posts[post_id].recent_views = total
+            result.append(posts[post_id])
+    return result
@@ -0,0 +1,53 @@
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, UserStats
+
+PAGE_SIZE = 20
+# largest id of a BigAutoField
+MAX_COMMENT_ID = 2 ** 63 - 1
+
+
+def comments_published(changes):
+    """
+    Updates the stats of the authors of comments whose approval changed.
+    `changes` are (user_id, post_id, delta) tuples, delta being 1 for a
+    comment that was just approved and -1 for one that no longer is, and
+    must be applied after the comments themselves were written.
+    """
+    comments, approved = Counter(), set()
+    for user_id, post_id, delta in changes:
+        comments[user_id] += delta
+        if delta > 0:
+            approved.add(user_id)
+    users = set(comments)
+    if not users:
+        return
+
+    # posts_commented is recounted rather than shifted: when several comments
+    # are deleted at once, every post_delete runs after all of them are gone
+    posts = (Comment.objects.filter(user=OuterRef('user'), status=Comment.APPROVED)
+             .order_by().values('user').annotate(count=Count('post', distinct=True)).values('count'))
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=user_id) for user_id in approved], ignore_conflicts=True)
+    for user_id in users:
+        UserStats.objects.filter(user_id=user_id).update(
+            comment_count=F('comment_count') + comments[user_id],
+            posts_commented=Coalesce(Subquery(posts), 0))
+
+
+def user_comments(user, before=None, size=PAGE_SIZE):
+    """
+    Returns a page of the published comments of `user` with their posts,
+    newest first and older than the comment id `before`, and the `before`
+    of the next page or None.
+    """
+    comments = Comment.objects.filter(user=user, status=Comment.APPROVED).select_related('post')
+    if before is not None:
+        comments = comments.filter(id__lt=before)
+    page = list(comments.order_by('-id')[:size + 1])
+    if len(page) > size:
+        return page[:size], page[size - 1].id
+    return page, None
@@ -0,0 +1,161 @@
+"""
+On-demand profiling of single requests.
+
+A staff user adds ?profile (or the X-Profile header) to a URL, and the
+request is run under cProfile with every SQL query and template render
+timed. The report is stored as a ProfileReport to read in the admin.
+Nothing here runs for other requests: the SQL and template hooks are
+only installed for the duration of a profiled request.
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+from .models import ProfileReport
+
+STATS_LINES = 60
+
+_local = threading.local()
+_lock = threading.Lock()
+_active = 0
+_original_render = None
+
+
+class QueryLogger:
+    """
+    Database execute wrapper recording each query with its duration.
+    """
+
+    def __init__(self, alias, queries):
+        self.alias = alias
+        self.queries = queries
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'database': self.alias,
+                'sql': sql,
+                'params': repr(params),
+                'many': many,
+                'time_ms': (time.perf_counter() - started) * 1000,
+            })
+
+
+def timed_render(self, context):
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        return _original_render(self, context)
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        # times of extended and included templates are part of their parent's
+        timings.append({
+            'template': self.origin.template_name or self.origin.name,
+            'time_ms': (time.perf_counter() - started) * 1000,
+        })
+
+
+@contextmanager
+def template_timer(timings):
+    """
+    Times the templates rendered by this thread. Template._render is only
+    replaced while a profiled request is running in some thread.
+    """
+    global _active, _original_render
+    with _lock:
+        if _active == 0:
+            _original_render = Template._render
+            Template._render = timed_render
+        _active += 1
+    _local.timings = timings
+    try:
+        yield
+    finally:
+        _local.timings = None
+        with _lock:
+            _active -= 1
+            if _active == 0:
+                Template._render = _original_render
+
+
+def find_duplicates(queries):
+    """
+    Returns the statements run more than once, most repeated first, with
+    how many of the runs also had the same parameters; the same SQL with
+    changing parameters usually means a query in a loop (N+1).
+    """
+    runs = Counter(query['sql'] for query in queries)
+    exact = Counter((query['sql'], query['params']) for query in queries)
+    repeated = Counter()
+    for (sql, params), count in exact.items():
+        repeated[sql] += count - 1
+    return [{'sql': sql, 'count': count, 'same_params': repeated[sql]}
+            for sql, count in runs.most_common() if count > 1]
+
+
+def requested(request):
+    param = getattr(settings, 'PROFILING_PARAM', 'profile')
+    header = 'HTTP_' + getattr(settings, 'PROFILING_HEADER', 'X-Profile').upper().replace('-', '_')
+    return header in request.META or (param in request.META.get('QUERY_STRING', '') and param in request.GET)
+
+
+def profile_request(request, get_response):
+    """
+    Runs the rest of the request under the profiler and stores the report.
+    Streamed responses are consumed inside the profiler, as that is when
+    their rows are queried and rendered.
+    """
+    queries, templates = [], []
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(QueryLogger(connection.alias, queries)))
+        stack.enter_context(template_timer(templates))
+        profiler.enable()
+        try:
+            response = get_response(request)
+            if response.streaming:
+                response.streaming_content = [b''.join(response.streaming_content)]
+        finally:
+            profiler.disable()
+    duration = (time.perf_counter() - started) * 1000
+
+    stats_text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_text)
+    stats.sort_stats('cumulative').print_stats(STATS_LINES)
+    duplicates = find_duplicates(queries)
+    report = ProfileReport.objects.create(
+        user=request.user,
+        method=request.method,
+        path=request.get_full_path()[:255],
+        status_code=response.status_code,
+        duration_ms=duration,
+        query_count=len(queries),
+        query_time_ms=sum(query['time_ms'] for query in queries),
+        duplicate_count=sum(duplicate['same_params'] for duplicate in duplicates),
+        queries=queries,
+        duplicates=duplicates,
+        templates=templates,
+        stats_text=stats_text.getvalue(),
+        stats_data=marshal.dumps(stats.stats),
+    )
+    keep = getattr(settings, 'PROFILING_KEEP_REPORTS', 100)
+    stale = list(ProfileReport.objects.order_by('-created_at', '-id').values_list('id', flat=True)[keep:])
+    if stale:
+        ProfileReport.objects.filter(id__in=stale).delete()
+    response['X-Profile-Report'] = str(report.pk)
+    return response
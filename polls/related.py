@@ -0,0 +1,226 @@
+"""
+Related posts from the TF-IDF cosine similarity of their text.
+
+A full build (rebuild_index) picks the MAX_FEATURES terms found in the most
+posts, stores them with their IDF as RelatedTerm rows and the vector of every
+post as a PostVector, then ranks all pairs in blocks. Saving a post only
+vectorises that post against the stored vocabulary and scores it against the
+stored vectors; terms the vocabulary doesn't know yet count from the next
+full build.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+
+from .models import Post, PostVector, RelatedPost, RelatedTerm
+
+TOP_K = 5
+MAX_FEATURES = 5000
+MAX_TERM_LENGTH = 100
+BLOCK_SIZE = 256
+TOKEN_RE = re.compile(r'\w\w+')
+FIELD_WEIGHTS = (('title_text', 3), ('category_text', 2), ('body_text', 1))
+
+
+def tokenize(values):
+    tokens = []
+    for field, weight in FIELD_WEIGHTS:
+        tokens.extend(TOKEN_RE.findall(values[field].lower()) * weight)
+    return tokens
+
+
+def load_documents():
+    """
+    Returns the ids of all posts and their weighted token lists.
+    """
+    fields = [field for field, weight in FIELD_WEIGHTS]
+    ids, documents = [], []
+    for values in Post.objects.values('id', *fields).order_by('id'):
+        ids.append(values['id'])
+        documents.append(tokenize(values))
+    return np.array(ids, dtype=np.int64), documents
+
+
+def build_vocabulary(documents):
+    """
+    Returns the MAX_FEATURES terms found in the most documents, mapped to
+    their column, and the IDF of each column.
+    """
+    document_frequency = Counter()
+    for tokens in documents:
+        document_frequency.update(token for token in set(tokens) if len(token) <= MAX_TERM_LENGTH)
+    # most_common keeps the first seen of equally frequent terms first
+    terms = document_frequency.most_common(MAX_FEATURES)
+    vocabulary = {term: column for column, (term, frequency) in enumerate(terms)}
+    frequencies = np.array([frequency for term, frequency in terms], dtype=np.float64)
+    idf = np.log((1 + len(documents)) / (1 + frequencies)) + 1
+    return vocabulary, idf.astype(np.float32)
+
+
+def vectorize(tokens, vocabulary, idf):
+    """
+    Returns the L2 normalised TF-IDF vector of a document as its non-zero
+    (columns, weights); terms outside the vocabulary are left out.
+    """
+    columns = np.array([vocabulary[token] for token in tokens if token in vocabulary], dtype=np.int32)
+    columns, counts = np.unique(columns, return_counts=True)
+    weights = (np.log1p(counts) * idf[columns]).astype(np.float32)
+    norm = np.linalg.norm(weights)
+    if norm:
+        weights /= norm
+    return columns, weights
+
+
+def pack(columns, weights):
+    return columns.astype('<i4').tobytes() + weights.astype('<f4').tobytes()
+
+
+def unpack(data):
+    data = bytes(data)
+    size = len(data) // 8
+    return np.frombuffer(data[:size * 4], dtype='<i4'), np.frombuffer(data[size * 4:], dtype='<f4')
+
+
+def tfidf_matrix(documents):
+    """
+    Builds the vocabulary and the L2 normalised TF-IDF matrix (one row per
+    document) over its columns only, so memory is bounded by documents *
+    MAX_FEATURES whatever the size of the full vocabulary.
+    Returns (matrix, vectors, vocabulary, idf), vectors being the sparse
+    (columns, weights) of every row.
+    """
+    vocabulary, idf = build_vocabulary(documents)
+    matrix = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+    vectors = []
+    for row, tokens in enumerate(documents):
+        columns, weights = vectorize(tokens, vocabulary, idf)
+        matrix[row, columns] = weights
+        vectors.append((columns, weights))
+    return matrix, vectors, vocabulary, idf
+
+
+def top_neighbours(scores, k):
+    """
+    Returns the column indexes of the k highest positive scores of every
+    row of `scores`, best first.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def rebuild_index(k=TOP_K):
+    """
+    Rebuilds the vocabulary, the post vectors and the neighbour lists of
+    every post. Similarities are computed in blocks of rows so memory stays
+    bounded by BLOCK_SIZE * posts.
+    """
+    ids, documents = load_documents()
+    matrix, vectors, vocabulary, idf = tfidf_matrix(documents)
+    del documents
+    links = []
+    if len(ids) > 1:
+        for start in range(0, len(ids), BLOCK_SIZE):
+            block = matrix[start:start + BLOCK_SIZE]
+            scores = block @ matrix.T
+            scores[np.arange(len(block)), np.arange(start, start + len(block))] = -1
+            neighbours = top_neighbours(scores, k)
+            for offset, row in enumerate(neighbours):
+                links.extend(make_links(ids[start + offset], ids[row], scores[offset, row]))
+    with transaction.atomic():
+        RelatedTerm.objects.all().delete()
+        RelatedTerm.objects.bulk_create(
+            [RelatedTerm(term=term, column=column, idf=idf[column]) for term, column in vocabulary.items()],
+            batch_size=1000)
+        PostVector.objects.all().delete()
+        PostVector.objects.bulk_create(
+            [PostVector(post_id=post_id, data=pack(*vector)) for post_id, vector in zip(ids.tolist(), vectors)],
+            batch_size=1000)
+        RelatedPost.objects.all().delete()
+        RelatedPost.objects.bulk_create(links, batch_size=1000)
+    return len(links)
+
+
+def load_vocabulary():
+    terms = list(RelatedTerm.objects.values_list('term', 'column', 'idf'))
+    idf = np.zeros(len(terms), dtype=np.float32)
+    vocabulary = {}
+    for term, column, value in terms:
+        vocabulary[term] = column
+        idf[column] = value
+    return vocabulary, idf
+
+
+def make_links(post_id, related_ids, scores):
+    return [
+        RelatedPost(post_id=post_id, related_id=related_id, score=score, rank=rank)
+        for rank, (related_id, score) in enumerate(zip(related_ids.tolist(), scores.tolist()))
+        if score > 0
+    ]
+
+
+def update_post(post_id, k=TOP_K):
+    """
+    Incrementally refreshes the index after `post_id` was created or edited:
+    only this post is vectorised, its own neighbour list is recomputed from
+    the stored vectors, and it is merged into the lists of the posts it is
+    now similar enough to. Without a stored vocabulary the index is built
+    from scratch.
+    """
+    fields = [field for field, weight in FIELD_WEIGHTS]
+    values = Post.objects.filter(pk=post_id).values(*fields).first()
+    if values is None:
+        return
+    vocabulary, idf = load_vocabulary()
+    if not vocabulary:
+        rebuild_index(k)
+        return
+    columns, weights = vectorize(tokenize(values), vocabulary, idf)
+    PostVector.objects.update_or_create(post_id=post_id, defaults={'data': pack(columns, weights)})
+
+    # scores against every other stored vector, from their non-zero entries
+    query = np.zeros(len(vocabulary), dtype=np.float32)
+    query[columns] = weights
+    ids, rows, entries = [], [], []
+    for row, (other_id, data) in enumerate(PostVector.objects.exclude(post_id=post_id).order_by('post_id')
+                                           .values_list('post_id', 'data').iterator()):
+        other_columns, other_weights = unpack(data)
+        ids.append(other_id)
+        rows.append(np.full(len(other_columns), row, dtype=np.intp))
+        entries.append(query[other_columns] * other_weights)
+    ids = np.array(ids, dtype=np.int64)
+    if not len(ids):
+        return
+    scores = np.bincount(np.concatenate(rows), weights=np.concatenate(entries), minlength=len(ids))
+
+    current = {}
+    links = RelatedPost.objects.exclude(post_id=post_id).values_list('post_id', 'related_id', 'score')
+    for other_id, related_id, score in links.iterator():
+        current.setdefault(other_id, {})[related_id] = score
+
+    affected = []
+    for other_id, score in zip(ids.tolist(), scores.tolist()):
+        neighbours = current.get(other_id, {})
+        if post_id in neighbours or (score > 0 and (len(neighbours) < k or score > min(neighbours.values()))):
+            if score > 0:
+                neighbours[post_id] = score
+            else:
+                neighbours.pop(post_id, None)
+            current[other_id] = neighbours
+            affected.append(other_id)
+
+    links = []
+    own = top_neighbours(scores[np.newaxis, :], k)[0]
+    links.extend(make_links(post_id, ids[own], scores[own]))
+    for other_id in affected:
+        best = sorted(current[other_id].items(), key=lambda item: item[1], reverse=True)[:k]
+        links.extend(make_links(other_id, np.array([i for i, s in best]), np.array([s for i, s in best])))
+
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=[post_id] + affected).delete()
+        RelatedPost.objects.bulk_create(links, batch_size=1000)
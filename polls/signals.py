@@ -0,0 +1,150 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from . import archive, imagemeta, profiles, suggest, tags
+from .models import Comment, CommentEvent, MediaFile, Post, PostTag
+
+
+def acquire_media(name):
+    if not name:
+        return
+    # waits for a running sweep_media to decide on this file
+    with transaction.atomic():
+        MediaFile.objects.select_for_update().get_or_create(name=name)
+        MediaFile.objects.filter(name=name).update(ref_count=F('ref_count') + 1)
+
+
+def release_media(name):
+    if not name:
+        return
+    MediaFile.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_image(sender, instance, raw=False, **kwargs):
+    instance._previous_image = None
+    if instance.pk and not raw:
+        instance._previous_image = Post.objects.filter(pk=instance.pk).values_list('image_file', flat=True).first()
+
+
+@receiver(pre_save, sender=Post)
+def update_image_metadata(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image_file:
+        return
+    if instance.image_width is not None and instance.image_file.name == getattr(instance, '_previous_image', None):
+        return
+    metadata = imagemeta.read_metadata(instance.image_file)
+    for field in imagemeta.METADATA_FIELDS:
+        setattr(instance, field, metadata[field] if metadata else Post._meta.get_field(field).get_default())
+
+
+@receiver(post_save, sender=Post)
+def count_image_reference(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_image', None)
+    current = instance.image_file.name
+    if previous != current:
+        acquire_media(current)
+        release_media(previous)
+
+
+@receiver(post_save, sender=Post)
+def update_related_posts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # numpy is only imported once a post actually changes
+    from . import related
+    transaction.on_commit(lambda: related.update_post(instance.pk))
+
+
+@receiver(post_save, sender=Post)
+def update_suggestions(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: suggest.post_saved(instance))
+
+
+@receiver(post_init, sender=Post)
+def remember_pub_date(sender, instance, **kwargs):
+    instance._loaded_pub_date = instance.__dict__.get('pub_date')
+
+
+@receiver(post_save, sender=Post)
+def count_monthly_posts(sender, instance, created, raw=False, **kwargs):
+    previous, instance._loaded_pub_date = instance._loaded_pub_date, instance.pub_date
+    if raw or (not created and previous == instance.pub_date):
+        return
+    months = [archive.month_of(instance.pub_date)]
+    if not created and previous is not None:
+        months.append(archive.month_of(previous))
+    archive.refresh_months(months)
+
+
+@receiver(post_init, sender=Comment)
+def remember_comment_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Comment)
+def announce_comment(sender, instance, created, raw=False, **kwargs):
+    # only published comments are shown; readers in every process get them
+    # from the outbox (see polls/events.py)
+    approved = instance.status == Comment.APPROVED and instance._loaded_status != Comment.APPROVED
+    if approved and not raw:
+        CommentEvent.objects.create(comment=instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_user_comments(sender, instance, created, raw=False, **kwargs):
+    was_approved = not created and instance._loaded_status == Comment.APPROVED
+    delta = (instance.status == Comment.APPROVED) - was_approved
+    if delta and not raw:
+        profiles.comments_published([(instance.user_id, instance.post_id, delta)])
+
+
+@receiver(post_save, sender=Comment)
+def reset_comment_status(sender, instance, **kwargs):
+    # registered after every receiver comparing with the loaded status
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_user_comment(sender, instance, **kwargs):
+    if instance._loaded_status == Comment.APPROVED:
+        profiles.comments_published([(instance.user_id, instance.post_id, -1)])
+
+
+@receiver(post_delete, sender=Post)
+def release_image_reference(sender, instance, **kwargs):
+    release_media(instance.image_file.name)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_monthly_post(sender, instance, **kwargs):
+    archive.refresh_months([archive.month_of(instance.pub_date)])
+
+
+@receiver(post_delete, sender=Post)
+def remove_suggestions(sender, instance, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: suggest.post_deleted(post_id))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def count_tagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_tags = (
+            [instance.pk] if reverse else list(instance.tags.values_list('pk', flat=True)))
+    elif action == 'post_clear':
+        tags.recount(getattr(instance, '_cleared_tags', []))
+    elif action in ('post_add', 'post_remove'):
+        tags.recount([instance.pk] if reverse else pk_set)
+
+
+@receiver(post_save, sender=PostTag)
+@receiver(post_delete, sender=PostTag)
+def count_tag_link(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tags.recount([instance.tag_id])
@@ -0,0 +1,48 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME_RE = re.compile(r'(^|/)[0-9a-f]{64}(\.[0-9a-z]+)?$')
+
+
+def is_hashed_name(name):
+    """
+    Return True if `name` was produced by HashedMediaStorage, meaning the
+    file behind it can never change.
+    """
+    return bool(HASHED_NAME_RE.search(name))
+
+
+@deconstructible
+class HashedMediaStorage(FileSystemStorage):
+    """
+    Stores uploads under the SHA-256 of their content, so the same image
+    uploaded twice is written once and its URL stays valid forever.
+    """
+
+    def content_hash(self, content):
+        sha = hashlib.sha256()
+        for chunk in content.chunks():
+            sha.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return sha.hexdigest()
+
+    def hashed_name(self, name, content):
+        dir_name, file_name = os.path.split(name)
+        ext = os.path.splitext(file_name)[1].lower()
+        return os.path.join(dir_name, self.content_hash(content) + ext).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return self._save(name, content)
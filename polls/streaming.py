@@ -0,0 +1,41 @@
+from itertools import islice
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+ROWS_MARKER = '<!-- rows -->'
+CHUNK_SIZE = 100
+
+
+def render_listing(request, template_name, rows_template, items, context=None, chunk_size=CHUNK_SIZE):
+    """
+    Renders a long listing page. `template_name` renders the page around
+    `{{ rows }}` and `rows_template` renders one chunk of `results`.
+
+    With STREAMING_LISTINGS on, the page head is sent as soon as the first
+    chunk of items is fetched and the remaining rows follow chunk by chunk,
+    so time to first byte doesn't grow with the number of results.
+    """
+    if hasattr(items, 'iterator'):
+        items = items.iterator(chunk_size=chunk_size)
+    items = iter(items)
+    first_chunk = list(islice(items, chunk_size))
+
+    context = dict(context or {}, results=first_chunk, rows=mark_safe(ROWS_MARKER))
+    # a page without results has no marker and is sent as a whole
+    head, marker, tail = render_to_string(template_name, context, request).partition(ROWS_MARKER)
+    rows_template = get_template(rows_template)
+
+    def chunks():
+        yield head
+        chunk = first_chunk
+        while chunk:
+            yield rows_template.render({'results': chunk}, request)
+            chunk = list(islice(items, chunk_size))
+        yield tail
+
+    if getattr(settings, 'STREAMING_LISTINGS', True):
+        return StreamingHttpResponse(chunks())
+    return HttpResponse(''.join(chunks()))
@@ -0,0 +1,202 @@
+import bisect
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Post
+
+WORD_RE = re.compile(r'\w+')
+
+
+def post_keys(title):
+    """
+    Returns the keys a title is found under: the whole title and every
+    suffix starting at a word, so "Tiger shark" matches "ti" and "sha".
+    """
+    title = title.lower()
+    return sorted({title[match.start():] for match in WORD_RE.finditer(title)} | {title})
+
+
+class PrefixIndex:
+    """
+    In-memory sorted-array index answering prefix queries with a binary
+    search. Holds at most `max_posts` posts, evicting the oldest first.
+    """
+
+    def __init__(self, max_posts):
+        self.max_posts = max_posts
+        self.lock = threading.Lock()
+        self.keys = []
+        self.values = []
+        self.posts = OrderedDict()
+        self.categories = {}
+
+    def build(self, posts):
+        """
+        Replaces the contents of the index with `posts`, an iterable of
+        (id, title, category, pub_date) tuples ordered oldest first.
+        """
+        with self.lock:
+            self.keys, self.values = [], []
+            self.posts = OrderedDict()
+            self.categories = {}
+            for post in deque(posts, maxlen=self.max_posts):
+                self._add(*post)
+            pairs = sorted(zip(self.keys, self.values), key=lambda pair: pair[0])
+            self.keys = [key for key, value in pairs]
+            self.values = [value for key, value in pairs]
+
+    def add(self, post_id, title, category, pub_date):
+        with self.lock:
+            self._remove(post_id)
+            self._add(post_id, title, category, pub_date, sort=True)
+            if len(self.posts) > self.max_posts:
+                self._remove(next(iter(self.posts)))
+
+    def remove(self, post_id):
+        with self.lock:
+            self._remove(post_id)
+
+    def _insert(self, key, value, sort):
+        if sort:
+            position = bisect.bisect_right(self.keys, key)
+            self.keys.insert(position, key)
+            self.values.insert(position, value)
+        else:
+            self.keys.append(key)
+            self.values.append(value)
+
+    def _delete(self, key, value):
+        position = bisect.bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key:
+            if self.values[position] is value:
+                del self.keys[position]
+                del self.values[position]
+                return
+            position += 1
+
+    def _add(self, post_id, title, category, pub_date, sort=False):
+        value = ('post', title, post_id, pub_date)
+        self.posts[post_id] = (value, category)
+        for key in post_keys(title):
+            self._insert(key, value, sort)
+        category_key = category.lower()
+        if category_key in self.categories:
+            self.categories[category_key][1] += 1
+        else:
+            category_value = ('category', category, None, None)
+            self.categories[category_key] = [category_value, 1]
+            for key in post_keys(category):
+                self._insert(key, category_value, sort)
+
+    def _remove(self, post_id):
+        if post_id not in self.posts:
+            return
+        value, category = self.posts.pop(post_id)
+        for key in post_keys(value[1]):
+            self._delete(key, value)
+        category_key = category.lower()
+        self.categories[category_key][1] -= 1
+        if self.categories[category_key][1] == 0:
+            category_value = self.categories.pop(category_key)[0]
+            for key in post_keys(category):
+                self._delete(key, category_value)
+
+    def search(self, prefix, limit=8, now=None):
+        """
+        Returns up to `limit` distinct (kind, label, post_id) suggestions
+        whose keys start with `prefix`, skipping unpublished posts.
+        """
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        now = now or timezone.now()
+        results, seen = [], set()
+        with self.lock:
+            position = bisect.bisect_left(self.keys, prefix)
+            end = min(len(self.keys), position + limit * 20)
+            while position < end and len(results) < limit and self.keys[position].startswith(prefix):
+                kind, label, post_id, pub_date = self.values[position]
+                position += 1
+                if (kind, label, post_id) in seen or (pub_date is not None and pub_date > now):
+                    continue
+                seen.add((kind, label, post_id))
+                results.append((kind, label, post_id))
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+POST_FIELDS = ('id', 'title_text', 'category_text', 'pub_date')
+
+
+def posts_state():
+    state = Post.objects.aggregate(count=Count('id'), updated=Max('updated_at'), last_id=Max('id'))
+    return state['count'], state['updated'], state['last_id']
+
+
+def build_index():
+    state = posts_state()
+    index = PrefixIndex(getattr(settings, 'SUGGEST_MAX_POSTS', 200000))
+    index.build(Post.objects.order_by('pub_date', 'id').values_list(*POST_FIELDS).iterator())
+    index.state = state
+    index.checked = time.monotonic()
+    return index
+
+
+def sync(index):
+    """
+    Brings the index up to date with the posts saved and deleted by other
+    processes, or before this process was forked from a preloaded master.
+    Posts updated since the last check are (re)added; if the number of posts
+    then doesn't add up, posts were deleted and the index is rebuilt.
+    Returns the up to date index.
+    """
+    index.checked = time.monotonic()
+    state = posts_state()
+    if state == index.state:
+        return index
+    count, updated, last_id = index.state
+    if updated is None:
+        return build_index()
+    changed = list(Post.objects.filter(updated_at__gte=updated).order_by('pub_date', 'id').values_list(*POST_FIELDS))
+    created = sum(post[0] > (last_id or 0) for post in changed)
+    if state[0] != count + created:
+        return build_index()
+    for post in changed:
+        index.add(*post)
+    index.state = state
+    return index
+
+
+def get_index():
+    """
+    Returns the process-wide index, building it from the database on first
+    use (or at startup when the app is preloaded). Each process applies
+    the changes of its own requests at once, and those made elsewhere when
+    it checks the posts table, at most every SUGGEST_SYNC_INTERVAL seconds.
+    """
+    global _index
+    if _index is None or time.monotonic() - _index.checked >= getattr(settings, 'SUGGEST_SYNC_INTERVAL', 5):
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+            elif time.monotonic() - _index.checked >= getattr(settings, 'SUGGEST_SYNC_INTERVAL', 5):
+                _index = sync(_index)
+    return _index
+
+
+def post_saved(post):
+    if _index is not None:
+        _index.add(post.pk, post.title_text, post.category_text, post.pub_date)
+
+
+def post_deleted(post_id):
+    if _index is not None:
+        _index.remove(post_id)
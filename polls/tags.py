@@ -0,0 +1,80 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import Post, PostTag, Tag
+
+CLOUD_SIZE = 30
+CLOUD_STEPS = 5
+
+
+def recount(tag_ids):
+    """
+    Refreshes the cached post_count of the given tags with one UPDATE.
+    """
+    counts = (PostTag.objects.filter(tag=OuterRef('pk')).order_by()
+              .values('tag').annotate(count=Count('post')).values('count'))
+    Tag.objects.filter(pk__in=list(tag_ids)).update(
+        post_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+def get_or_create_tags(names):
+    """
+    Returns the tags with the given names in the same order, creating the
+    missing ones.
+    """
+    tags = {}
+    for name in names:
+        name = name.strip()
+        if name and slugify(name):
+            tags.setdefault(slugify(name), name)
+    Tag.objects.bulk_create([Tag(name=name, slug=slug) for slug, name in tags.items()], ignore_conflicts=True)
+    order = {slug: position for position, slug in enumerate(tags)}
+    return sorted(Tag.objects.filter(slug__in=tags), key=lambda tag: order[tag.slug])
+
+
+def tag_posts(post_ids, tags):
+    """
+    Adds every tag to every post with a single insert into the through
+    table, then refreshes the counts of those tags.
+    Returns the number of new (tag, post) pairs.
+    """
+    post_ids = list(post_ids)
+    tag_ids = [tag.pk for tag in tags]
+    existing = set(PostTag.objects.filter(post_id__in=post_ids, tag_id__in=tag_ids).values_list('tag_id', 'post_id'))
+    links = [PostTag(tag_id=tag_id, post_id=post_id)
+             for tag_id in tag_ids for post_id in post_ids if (tag_id, post_id) not in existing]
+    PostTag.objects.bulk_create(links, ignore_conflicts=True)
+    recount(tag_ids)
+    return len(links)
+
+
+def posts_with_all_tags(slugs):
+    """
+    Returns the tags named by `slugs` and the published posts carrying all
+    of them, answered from the inverted index, or (None, None) if a tag
+    doesn't exist.
+    """
+    slugs = set(slugs)
+    tags = list(Tag.objects.filter(slug__in=slugs).order_by('post_count'))
+    if len(tags) != len(slugs):
+        return None, None
+    matching = (PostTag.objects.filter(tag__in=tags).values('post')
+                .annotate(matched=Count('tag')).filter(matched=len(tags)).values('post'))
+    posts = Post.objects.filter(pk__in=matching, pub_date__lte=timezone.now()).order_by('-pub_date')
+    return tags, posts
+
+
+def tag_cloud(size=CLOUD_SIZE):
+    """
+    Returns the most used tags, each with a `weight` from 1 to CLOUD_STEPS,
+    read from the cached counts alone.
+    """
+    tags = list(Tag.objects.filter(post_count__gt=0).order_by('-post_count', 'name')[:size])
+    if tags:
+        most, least = tags[0].post_count, tags[-1].post_count
+        for tag in tags:
+            tag.weight = 1 + round((CLOUD_STEPS - 1) * (tag.post_count - least) / max(most - least, 1))
+        tags.sort(key=lambda tag: tag.name.lower())
+    return tags
@@ -1,17 +1,31 @@
 import datetime
 from time import sleep
-from tkinter.tix import Tree
 from django.test import TestCase
 from django.utils import timezone
 from django.urls import reverse
-from .models import Post, Comment
+from .models import DEFAULT_IMAGE, Post, Comment, MediaFile, RelatedPost, PostStats, Tag, PostTag, UserStats, MonthlyPostCount, ProfileReport, PostVector, RelatedTerm
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from . import archive, events, middleware, moderation, pageviews, profiles, profiling, related, suggest, tags
+import gzip
+import asyncio
+import threading
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.template.base import Template
+from .management.commands.sweep_media import Command as SweepMediaCommand
+from django.test import override_settings
 from django.contrib.auth.models import User
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
 from . import urls
 
+import io
+from unittest import mock
+import marshal
 import os
+import shutil
+import tempfile
 import lorem
 import random
 import string
@@ -150,10 +164,20 @@ class PostDetailViewTests(TestCase):
         past_post = create_post(title_text='Past Question.', days=-5)
         body = lorem.text()
         user = User.objects.create_user(username="testUser", email="testEmail@email.com", password="password")
-        post_comment = Comment.objects.create(post = past_post, user = user, body_text = body)
+        post_comment = Comment.objects.create(post = past_post, user = user, body_text = body, status = Comment.APPROVED)
         response = self.client.get(reverse('show', args=(past_post.id,)))
         self.assertContains(response, post_comment.body_text)
 
+    def test_pending_comment(self):
+        """
+        The detail view of a post doesn't show comments awaiting moderation
+        """
+        past_post = create_post(title_text='Past Question.', days=-5)
+        user = User.objects.create_user(username="testUser", email="testEmail@email.com", password="password")
+        Comment.objects.create(post = past_post, user = user, body_text = "Waiting for review")
+        response = self.client.get(reverse('show', args=(past_post.id,)))
+        self.assertNotContains(response, "Waiting for review")
+
 class PagesStatusTests(TestCase):
     def test_index(self):
         response = self.client.get(reverse('index'))
@@ -237,8 +261,884 @@ class CategoriesTests(TestCase):
         else:
             self.assertContains(response, category)
 
+class TemporaryMediaMixin:
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_post_with_image(self, file_name, content):
+        post = create_post(title_text="Image post", days=-1)
+        post.image_file.save(file_name, ContentFile(content))
+        return post
+
+
+class MediaStorageTests(TemporaryMediaMixin, TestCase):
+    def test_same_content_stored_once(self):
+        """
+        Uploading the same image twice stores a single file named after
+        its content hash and counts both references.
+        """
+        post1 = self.create_post_with_image("a.JPG", b"same image")
+        post2 = self.create_post_with_image("b.jpg", b"same image")
+        self.assertEqual(post1.image_file.name, post2.image_file.name)
+        self.assertRegex(post1.image_file.name, r'^photos/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'photos')), [os.path.basename(post1.image_file.name)])
+        self.assertEqual(MediaFile.objects.get(name=post1.image_file.name).ref_count, 2)
+
+    def test_sweep_deletes_orphans(self):
+        """
+        sweep_media deletes files whose last referencing post is gone and
+        keeps files that are still used.
+        """
+        kept = self.create_post_with_image("kept.jpg", b"kept image")
+        orphan = self.create_post_with_image("orphan.jpg", b"orphan image")
+        orphan_name = orphan.image_file.name
+        orphan.delete()
+        call_command('sweep_media', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, kept.image_file.name)))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, orphan_name)))
+        self.assertFalse(MediaFile.objects.filter(name=orphan_name).exists())
+
+    def test_sweep_keeps_default_image(self):
+        """
+        The shared default image is never swept, even when no post uses it.
+        """
+        os.makedirs(os.path.join(self.media_root, 'photos'))
+        with open(os.path.join(self.media_root, DEFAULT_IMAGE), 'wb') as f:
+            f.write(b"default image")
+        create_post(title_text="Default image post", days=-1).delete()
+        self.assertEqual(MediaFile.objects.get(name=DEFAULT_IMAGE).ref_count, 0)
+        out = io.StringIO()
+        call_command('sweep_media', stdout=out)
+        self.assertIn('0 orphaned file(s) deleted', out.getvalue())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, DEFAULT_IMAGE)))
+
+    def test_sweep_rechecks_references(self):
+        """
+        A file referenced again after the sweep listed it is kept.
+        """
+        post = self.create_post_with_image("reused.jpg", b"reused image")
+        name = post.image_file.name
+        post.delete()
+        command = SweepMediaCommand(stdout=io.StringIO())
+        self.create_post_with_image("again.jpg", b"reused image")
+        self.assertFalse(command.delete(name))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, name)))
+
+
+class ImageMetadataTests(TemporaryMediaMixin, TestCase):
+    def image_content(self, color):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_metadata_computed_on_upload(self):
+        """
+        Uploading an image stores its size, dominant colour and placeholder,
+        and the pages emit them.
+        """
+        post = self.create_post_with_image("red.png", self.image_content((255, 0, 0)))
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height, post.image_color), (40, 30, '#ff0000'))
+        self.assertTrue(post.image_placeholder.startswith('data:image/jpeg;base64,'))
+        response = self.client.get(reverse('photos'))
+        self.assertContains(response, 'width="40" height="30"')
+        response = self.client.get(reverse('show', args=(post.id,)))
+        self.assertContains(response, 'width="40" height="30"')
+
+    def test_backfill(self):
+        """
+        backfill_image_meta fills in the metadata of existing posts.
+        """
+        post = self.create_post_with_image("blue.png", self.image_content((0, 0, 255)))
+        Post.objects.update(image_width=None, image_height=None, image_color='', image_placeholder='')
+        call_command('backfill_image_meta', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height, post.image_color), (40, 30, '#0000ff'))
+
+
+class RelatedPostsTests(TestCase):
+    def create_posts(self):
+        sharks = create_post(title_text="Great white shark", days=-3, category="fish")
+        Post.objects.filter(pk=sharks.pk).update(body_text="sharks hunt in the ocean")
+        tiger = create_post(title_text="Tiger shark", days=-2, category="fish")
+        Post.objects.filter(pk=tiger.pk).update(body_text="tiger sharks hunt in the ocean")
+        cat = create_post(title_text="House cat", days=-1, category="mammals")
+        Post.objects.filter(pk=cat.pk).update(body_text="cats sleep on the sofa")
+        return sharks, tiger, cat
+
+    def test_build_index(self):
+        """
+        The rebuilt index ranks the most similar post first and the detail
+        view shows it in the related posts panel.
+        """
+        sharks, tiger, cat = self.create_posts()
+        related.rebuild_index()
+        self.assertEqual(RelatedPost.objects.filter(post=sharks).order_by('rank').first().related, tiger)
+        response = self.client.get(reverse('show', args=(sharks.id,)))
+        self.assertEqual(response.context['related_posts'][0], tiger)
+        self.assertContains(response, 'Related posts')
+
+    def test_new_post_updates_index(self):
+        """
+        Saving a post updates its own neighbours and the lists of the posts
+        it is similar to without a full rebuild.
+        """
+        sharks, tiger, cat = self.create_posts()
+        related.rebuild_index()
+        # only the saved post is vectorised, against the stored vocabulary
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch.object(related, 'load_documents', side_effect=AssertionError):
+            hammerhead = Post.objects.create(title_text="Hammerhead shark", category_text="fish",
+                                             body_text="hammerhead sharks hunt in the ocean", pub_date=timezone.now())
+        self.assertTrue(RelatedPost.objects.filter(post=hammerhead, related=sharks).exists())
+        self.assertTrue(RelatedPost.objects.filter(post=tiger, related=hammerhead).exists())
+        self.assertNotEqual(RelatedPost.objects.filter(post=hammerhead).order_by('rank').first().related, cat)
+        self.assertTrue(PostVector.objects.filter(post=hammerhead).exists())
+
+    def test_first_post_builds_index(self):
+        """
+        Without a stored vocabulary, saving a post builds the whole index.
+        """
+        sharks, tiger, cat = self.create_posts()
+        related.update_post(tiger.pk)
+        self.assertTrue(RelatedTerm.objects.exists())
+        self.assertEqual(RelatedPost.objects.filter(post=sharks).order_by('rank').first().related, tiger)
+
+    def test_vocabulary_is_bounded(self):
+        """
+        The matrix only has columns for the MAX_FEATURES most frequent terms.
+        """
+        documents = [["common", "word%d" % n] for n in range(50)]
+        with mock.patch.object(related, 'MAX_FEATURES', 10):
+            matrix, vectors, vocabulary, idf = related.tfidf_matrix(documents)
+        self.assertEqual(matrix.shape, (50, 10))
+        self.assertEqual(list(vocabulary)[0], "common")
+        columns, weights = vectors[0]
+        self.assertEqual(matrix[0, columns].tolist(), weights.tolist())
+
+
+class SuggestTests(TestCase):
+    def setUp(self):
+        suggest._index = None
+
+    def tearDown(self):
+        suggest._index = None
+
+    def test_suggestions(self):
+        """
+        Suggestions match title words and categories by prefix and never
+        include posts that aren't published yet.
+        """
+        post = create_post(title_text="Tiger shark", days=-1, category="fish")
+        create_post(title_text="Shark week", days=5, category="fish")
+        response = self.client.get(reverse('suggest'), {'q': 'sha'})
+        self.assertEqual(response.json()['suggestions'], [
+            {'kind': 'post', 'label': 'Tiger shark', 'url': reverse('show', args=(post.id,))},
+        ])
+        response = self.client.get(reverse('suggest'), {'q': 'FI'})
+        self.assertEqual(response.json()['suggestions'][0]['kind'], 'category')
+
+    def test_category_with_slash(self):
+        post = create_post(title_text="Zoo trip", days=-1, category="zoo/safari")
+        response = self.client.get(reverse('suggest'), {'q': 'zoo'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['suggestions'], [
+            {'kind': 'post', 'label': 'Zoo trip', 'url': reverse('show', args=(post.id,))},
+        ])
+
+    def test_index_follows_post_changes(self):
+        """
+        Saving and deleting posts updates an already built index.
+        """
+        index = suggest.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            post = create_post(title_text="Sleepy otter", days=-1)
+        self.assertEqual(index.search('otter'), [('post', 'Sleepy otter', post.id)])
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(index.search('otter'), [])
+        self.assertEqual(index.keys, [])
+
+    @override_settings(SUGGEST_SYNC_INTERVAL=0)
+    def test_index_follows_other_processes(self):
+        """
+        Posts saved and deleted by other processes, whose signals this
+        process never sees, are picked up from the posts table.
+        """
+        post = create_post(title_text="Sleepy otter", days=-1)
+        index = suggest.get_index()
+        # none of these run this process's on-commit callbacks
+        other = create_post(title_text="Otter pup", days=-1)
+        Post.objects.filter(pk=post.pk).update(title_text="Sleepy seal", updated_at=timezone.now())
+        self.assertIs(suggest.get_index(), index)
+        self.assertEqual(index.search('otter'), [('post', 'Otter pup', other.id)])
+        self.assertEqual(index.search('seal'), [('post', 'Sleepy seal', post.id)])
+        Post.objects.filter(pk=other.pk).delete()
+        self.assertEqual(suggest.get_index().search('otter'), [])
+
+    def test_bounded_size(self):
+        index = suggest.PrefixIndex(max_posts=2)
+        now = timezone.now()
+        index.build([(1, 'Old', 'a', now), (2, 'Middle', 'a', now), (3, 'New', 'a', now)])
+        self.assertEqual(index.search('old'), [])
+        index.add(4, 'Newest', 'b', now)
+        self.assertEqual(list(index.posts), [3, 4])
+
+
+class FeedTests(TestCase):
+    def test_feeds_list_published_posts(self):
+        """
+        The site and category feeds list published posts only.
+        """
+        create_post(title_text="Past shark", days=-1, category="fish")
+        create_post(title_text="Future shark", days=5, category="fish")
+        create_post(title_text="Past cat", days=-1, category="cats")
+        for url in (reverse('rss'), reverse('atom')):
+            response = self.client.get(url)
+            self.assertContains(response, "Past shark")
+            self.assertContains(response, "Past cat")
+            self.assertNotContains(response, "Future shark")
+        response = self.client.get(reverse('category_rss', args=("fish",)))
+        self.assertContains(response, "Past shark")
+        self.assertNotContains(response, "Past cat")
+
+    def test_conditional_get(self):
+        """
+        Polling with the returned ETag gets 304 until a post changes.
+        """
+        post = create_post(title_text="Past shark", days=-1)
+        response = self.client.get(reverse('rss'))
+        etag = response['ETag']
+        response = self.client.get(reverse('rss'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        post.title_text = "Edited shark"
+        post.save()
+        response = self.client.get(reverse('rss'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Edited shark")
+
+    def test_sitemap(self):
+        post = create_post(title_text="Past shark", days=-1)
+        future = create_post(title_text="Future shark", days=5)
+        response = self.client.get(reverse('sitemap'))
+        self.assertContains(response, reverse('show', args=(post.id,)))
+        self.assertNotContains(response, reverse('show', args=(future.id,)))
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_cached_per_host_and_scheme(self):
+        """
+        The absolute links of a cached feed are those of the site requested,
+        and query strings don't make new cache entries.
+        """
+        post = create_post(title_text="Past shark", days=-1)
+        link = reverse('show', args=(post.id,))
+        for url in (reverse('rss'), reverse('atom'), reverse('sitemap')):
+            response = self.client.get(url, HTTP_HOST='a.example')
+            self.assertContains(response, 'http://a.example' + link)
+            response = self.client.get(url, HTTP_HOST='b.example', secure=True)
+            self.assertContains(response, 'https://b.example' + link)
+            self.assertNotContains(response, 'a.example')
+        with mock.patch.object(cache, 'set') as cache_set:
+            self.client.get(reverse('rss'), {'x': 1}, HTTP_HOST='a.example')
+        cache_set.assert_not_called()
+
+
+class EventsTests(TestCase):
+    def test_burst_is_coalesced(self):
+        """
+        Comments published from other threads reach the subscribed stream
+        and a burst of them is sent in a single write.
+        """
+        sent = []
+
+        async def scenario():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/events/posts/7/comments'}
+            stream = asyncio.ensure_future(events.sse_application(scope, receive, send))
+            await asyncio.sleep(0.01)
+            publisher = threading.Thread(target=lambda: [
+                events.hub.publish('post:7:comments', 'comment', {'body': n}) for n in range(3)])
+            publisher.start()
+            publisher.join()
+            await asyncio.sleep(events.COALESCE_DELAY + 0.1)
+            disconnected.set()
+            await stream
+
+        asyncio.run(scenario())
+        self.assertEqual(sent[0]['status'], 200)
+        bodies = [message['body'] for message in sent[2:]]
+        self.assertEqual(len(bodies), 1)
+        self.assertEqual(bodies[0].count(b'event: comment'), 3)
+        self.assertEqual(events.hub.topics, {})
+
+    def test_comment_feed(self):
+        """
+        Approvals made anywhere, including in bulk by the moderation worker,
+        reach the readers of the post once, through the outbox.
+        """
+        post = create_post(title_text="Past post.", days=-1)
+        other_post = create_post(title_text="Other post.", days=-1)
+        user = User.objects.create_user(username="testUser", password="password")
+        old_comment = Comment.objects.create(post=post, user=user, body_text="Old comment")
+        old_comment.status = Comment.APPROVED
+        old_comment.save()
+
+        published = []
+        stub_hub = mock.Mock(topics={'post:%d:comments' % post.id: set()})
+        stub_hub.publish.side_effect = lambda topic, event, data: published.append((topic, data['body']))
+        feed = events.CommentFeed(stub_hub)
+        feed.poll()
+        Comment.objects.create(post=post, user=user, body_text="What a cute shark, thanks!")
+        Comment.objects.create(post=other_post, user=user, body_text="Nice photo of the tiger")
+        call_command('moderate_comments', stdout=io.StringIO())
+        approved_by_hand = Comment.objects.create(post=post, user=user, body_text="Hold on")
+        approved_by_hand.status = Comment.APPROVED
+        approved_by_hand.save()
+        feed.poll()
+        feed.poll()
+        topic = 'post:%d:comments' % post.id
+        self.assertEqual(published, [(topic, "What a cute shark, thanks!"), (topic, "Hold on")])
+
+    def test_post_feed(self):
+        """
+        Posts saved anywhere reach the readers of the index once, as they
+        are created or, for scheduled posts, once their pub_date passes.
+        """
+        create_post(title_text="Old post.", days=-1)
+        published = []
+        stub_hub = mock.Mock(topics={'posts': set()})
+        stub_hub.publish.side_effect = lambda topic, event, data: published.append(data['title'])
+        feed = events.PostFeed(stub_hub)
+        feed.poll()
+        create_post(title_text="New post.", days=-1)
+        Post.objects.create(title_text="Soon.", pub_date=timezone.now() + datetime.timedelta(seconds=1),
+                            body_text="", category_text="test")
+        feed.poll()
+        self.assertEqual(published, ["New post."])
+        sleep(1.5)
+        feed.poll()
+        feed.poll()
+        self.assertEqual(published, ["New post.", "Soon."])
+
+    def test_store_comment(self):
+        post = create_post(title_text="Past post.", days=-1)
+        user = User.objects.create_user(username="testUser", password="password")
+        self.client.force_login(user)
+        response = self.client.post(reverse('storeComment', args=(post.id,)), {'body': "Nice shark"})
+        self.assertRedirects(response, reverse('show', args=(post.id,)))
+        self.assertEqual(Comment.objects.get().user, user)
+
+
+class ModerationTests(TestCase):
+    def test_moderate_comments(self):
+        """
+        The moderation worker publishes ham, rejects spam and leaves
+        already scored comments alone.
+        """
+        post = create_post(title_text="Past post.", days=-1)
+        user = User.objects.create_user(username="testUser", password="password")
+        ham = Comment.objects.create(post=post, user=user, body_text="What a cute shark, thanks!")
+        spam = Comment.objects.create(post=post, user=user, body_text="BUY CHEAP CRYPTO AT www.example.ru")
+        call_command('moderate_comments', stdout=io.StringIO())
+        ham.refresh_from_db()
+        spam.refresh_from_db()
+        self.assertEqual(ham.status, Comment.APPROVED)
+        self.assertEqual(spam.status, Comment.REJECTED)
+        self.assertGreater(spam.spam_score, ham.spam_score)
+        response = self.client.get(reverse('show', args=(post.id,)))
+        self.assertEqual(response.context['comments'], [ham])
+
+    def test_trains_on_human_decisions(self):
+        """
+        The scorer learns from comments approved or rejected in the admin,
+        not from its own decisions or from comments published before.
+        """
+        post = create_post(title_text="Past post.", days=-1)
+        user = User.objects.create_user(username="testUser", password="password")
+        Comment.objects.create(post=post, user=user, body_text="Zebra stripes")
+        call_command('moderate_comments', stdout=io.StringIO())
+        Comment.objects.create(post=post, user=user, body_text="Legacy giraffe", status=Comment.APPROVED)
+        approved = Comment.objects.create(post=post, user=user, body_text="Okapi pictures")
+        rejected = Comment.objects.create(post=post, user=user, body_text="Lemur offers")
+
+        self.client.force_login(User.objects.create_superuser(username="admin", password="password"))
+        self.client.post(reverse('admin:polls_comment_changelist'), {
+            'action': 'approve_comments', '_selected_action': [approved.id]})
+        self.client.post(reverse('admin:polls_comment_change', args=(rejected.id,)), {
+            'user': user.id, 'post': post.id, 'body_text': rejected.body_text, 'status': Comment.REJECTED})
+        rejected.refresh_from_db()
+        self.assertEqual(rejected.status, Comment.REJECTED)
+
+        vocabulary = moderation.train_scorer().vocabulary
+        self.assertIn('okapi', vocabulary)
+        self.assertIn('lemur', vocabulary)
+        self.assertNotIn('zebra', vocabulary)
+        self.assertNotIn('giraffe', vocabulary)
+
+
+class CompressionTests(TestCase):
+    def test_gzip_and_brotli(self):
+        """
+        Pages are compressed with the best encoding the client accepts.
+        """
+        create_post(title_text="Past post.", days=-1)
+        response = self.client.get(reverse('index'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'Past post.', gzip.decompress(response.content))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.client.get(reverse('index'), HTTP_ACCEPT_ENCODING='gzip, br')
+        if middleware.brotli is not None:
+            self.assertEqual(response['Content-Encoding'], 'br')
+        response = self.client.get(reverse('index'), HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_thresholds(self):
+        """
+        Small bodies and content types outside the allowlist are sent as is.
+        """
+        response = self.client.get(reverse('suggest'), {'q': 'x'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        with override_settings(COMPRESSION_CONTENT_TYPES=['application/json']):
+            response = self.client.get(reverse('index'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streamed_listing(self):
+        """
+        Long listings are streamed in chunks and compressed on the fly.
+        """
+        for n in range(250):
+            Post.objects.create(title_text="Post %d" % n, category_text="fish", body_text="", pub_date=timezone.now())
+        response = self.client.get(reverse('categories', args=("fish",)))
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual(b''.join(chunks).count(b'list-group-item'), 250)
+        response = self.client.get(reverse('search', args=("Post",)), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).count(b'list-group-item'), 250)
+
+
+class TagTests(TestCase):
+    def setUp(self):
+        self.fish, self.cute = tags.get_or_create_tags(["Fish", "Cute"])
+        self.shark = create_post(title_text="Shark", days=-2)
+        self.goldfish = create_post(title_text="Goldfish", days=-1)
+        self.kitten = create_post(title_text="Kitten", days=-1)
+        self.shark.tags.add(self.fish)
+        self.goldfish.tags.add(self.fish, self.cute)
+        self.kitten.tags.add(self.cute)
+
+    def test_counts(self):
+        """
+        Tag counts follow adding, removing and deleting tagged posts.
+        """
+        self.fish.refresh_from_db()
+        self.assertEqual(self.fish.post_count, 2)
+        self.shark.tags.remove(self.fish)
+        self.goldfish.delete()
+        self.fish.refresh_from_db()
+        self.assertEqual(self.fish.post_count, 0)
+
+    def test_intersection(self):
+        """
+        A tag page lists posts carrying every one of the tags.
+        """
+        content = b''.join(self.client.get(reverse('tags', args=("fish",))).streaming_content)
+        self.assertIn(b"Shark", content)
+        self.assertIn(b"Goldfish", content)
+        content = b''.join(self.client.get(reverse('tags', args=("fish+cute",))).streaming_content)
+        self.assertIn(b"Goldfish", content)
+        self.assertNotIn(b"Shark", content)
+        self.assertNotIn(b"Kitten", content)
+        response = self.client.get(reverse('tags', args=("fish+unknown",)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_cloud_and_bulk_tagging(self):
+        """
+        The admin bulk action tags many posts at once and the index tag
+        cloud shows the new counts.
+        """
+        admin_user = User.objects.create_superuser(username="admin", password="password")
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:polls_post_changelist'), {
+            'action': 'add_tags',
+            '_selected_action': [self.shark.pk, self.kitten.pk],
+            'apply': '1',
+            'tags': 'Ocean, Cute',
+        })
+        self.assertEqual(Tag.objects.get(slug='ocean').post_count, 2)
+        self.assertEqual(Tag.objects.get(slug='cute').post_count, 3)
+        response = self.client.get(reverse('index'))
+        self.assertEqual([tag.name for tag in response.context['tag_cloud']], ["Cute", "Fish", "Ocean"])
+        self.assertContains(response, 'tag-weight-5')
+
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testUser", password="password")
+        self.post = create_post(title_text="Past post.", days=-1)
+
+    def assertStats(self, comment_count, posts_commented):
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.comment_count, stats.posts_commented), (comment_count, posts_commented))
+
+    def test_stats_follow_moderation(self):
+        """
+        Only published comments are counted, as they are approved,
+        rejected and deleted.
+        """
+        other_post = create_post(title_text="Other post.", days=-1)
+        first = Comment.objects.create(post=self.post, user=self.user, body_text="First")
+        self.assertFalse(UserStats.objects.filter(user=self.user).exists())
+        first.status = Comment.APPROVED
+        first.save()
+        self.assertStats(1, 1)
+        Comment.objects.create(post=self.post, user=self.user, body_text="Second", status=Comment.APPROVED)
+        self.assertStats(2, 1)
+        third = Comment.objects.create(post=other_post, user=self.user, body_text="Third", status=Comment.APPROVED)
+        self.assertStats(3, 2)
+        first.status = Comment.REJECTED
+        first.save()
+        self.assertStats(2, 2)
+        third.delete()
+        self.assertStats(1, 1)
+        self.post.delete()
+        self.assertStats(0, 0)
+
+    def test_stats_from_moderation_worker(self):
+        """
+        Comments approved in bulk by the moderation worker are counted too.
+        """
+        Comment.objects.create(post=self.post, user=self.user, body_text="What a cute shark, thanks!")
+        Comment.objects.create(post=self.post, user=self.user, body_text="Nice photo of the tiger")
+        call_command('moderate_comments', stdout=io.StringIO())
+        self.assertStats(2, 1)
+
+    def test_stats_after_deleting_several_comments(self):
+        """
+        Deleting several published comments on the same post at once, from
+        a queryset or with their post, leaves the other posts counted.
+        """
+        other_post = create_post(title_text="Other post.", days=-1)
+        for post in (self.post, self.post, other_post, other_post):
+            Comment.objects.create(post=post, user=self.user, body_text="Comment", status=Comment.APPROVED)
+        Comment.objects.filter(post=other_post).delete()
+        self.assertStats(2, 1)
+        Comment.objects.create(post=other_post, user=self.user, body_text="Again", status=Comment.APPROVED)
+        self.post.delete()
+        self.assertStats(1, 1)
+
+    def test_keyset_pagination(self):
+        """
+        The profile lists published comments newest first, one page at a
+        time, with the same number of queries however many there are.
+        """
+        Comment.objects.create(post=self.post, user=self.user, body_text="Hidden")
+        Comment.objects.bulk_create([
+            Comment(post=self.post, user=self.user, body_text="Comment %d" % n, status=Comment.APPROVED)
+            for n in range(profiles.PAGE_SIZE + 5)
+        ])
+        url = reverse('profile', args=("testUser",))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        first_page = response.context['comments']
+        self.assertEqual(len(first_page), profiles.PAGE_SIZE)
+        self.assertEqual(first_page[0].body_text, "Comment %d" % (profiles.PAGE_SIZE + 4))
+        self.assertNotContains(response, "Hidden")
+
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url, {'before': response.context['next_before']})
+        self.assertEqual([comment.body_text for comment in response.context['comments']],
+                         ["Comment %d" % n for n in range(4, -1, -1)])
+        self.assertIsNone(response.context['next_before'])
+        self.assertContains(response, "Past post.")
+
+        # ids beyond the database's integers are treated as no cursor
+        response = self.client.get(url, {'before': '99999999999999999999999'})
+        self.assertEqual(response.context['comments'], first_page)
+        response = self.client.get(url, {'before': '-99999999999999999999999'})
+        self.assertEqual(response.context['comments'], [])
+
+    def test_unknown_user(self):
+        response = self.client.get(reverse('profile', args=("nobody",)))
+        self.assertEqual(response.status_code, 404)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self, title_text, year, month, day=10):
+        pub_date = timezone.make_aware(datetime.datetime(year, month, day, 12))
+        return Post.objects.create(title_text=title_text, pub_date=pub_date, body_text="", category_text="test")
+
+    def test_histogram_follows_posts(self):
+        """
+        The monthly counts are refreshed as posts are added, moved to
+        another month and deleted, and scheduled posts are only counted
+        once published.
+        """
+        march = self.create_post("March post.", 2021, 3)
+        self.create_post("Another March post.", 2021, 3, day=31)
+        self.create_post("May post.", 2021, 5, day=1)
+        march_first, may_first = datetime.date(2021, 3, 1), datetime.date(2021, 5, 1)
+        self.assertEqual(archive.histogram(), [(may_first, 1), (march_first, 2)])
+        march.pub_date = timezone.make_aware(datetime.datetime(2021, 5, 20))
+        march.save()
+        self.assertEqual(archive.histogram(), [(may_first, 2), (march_first, 1)])
+        march.delete()
+        self.assertEqual(archive.histogram(), [(may_first, 1), (march_first, 1)])
+
+        Post.objects.create(title_text="Soon.", pub_date=timezone.now() + datetime.timedelta(seconds=1),
+                            body_text="", category_text="test")
+        self.assertEqual(len(archive.histogram()), 2)
+        sleep(1.5)
+        this_month = archive.month_of(timezone.now())
+        self.assertEqual(archive.histogram()[0], (this_month, 1))
+
+    def test_scheduled_post_published_with_cold_cache(self):
+        """
+        A scheduled post is counted once published, even when the cache was
+        emptied (or the process started) in between.
+        """
+        post = Post.objects.create(title_text="Soon.", pub_date=timezone.now() + datetime.timedelta(seconds=1),
+                                   body_text="", category_text="test")
+        self.assertEqual(archive.histogram(), [])
+        sleep(1.5)
+        cache.clear()
+        self.assertEqual(archive.histogram(), [(archive.month_of(post.pub_date), 1)])
+        response = self.client.get(reverse('archive_year', args=(timezone.localtime(post.pub_date).year,)))
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_timeout(self):
+        """
+        The histogram is cached for a bounded time, as other processes can't
+        invalidate it, and only until the next scheduled post goes live.
+        """
+        self.create_post("Old post.", 2021, 3)
+        with mock.patch.object(archive.cache, 'set') as cache_set:
+            archive.histogram()
+        self.assertEqual(cache_set.call_args[0][2], archive.HISTOGRAM_CACHE_TIMEOUT)
+        Post.objects.create(title_text="Soon.", pub_date=timezone.now() + datetime.timedelta(seconds=10),
+                            body_text="", category_text="test")
+        with mock.patch.object(archive.cache, 'set') as cache_set:
+            archive.histogram()
+        self.assertLessEqual(cache_set.call_args[0][2], 10)
+
+    def test_rebuild(self):
+        """
+        The single aggregation counts the same months as the incremental
+        refreshes.
+        """
+        for day in range(1, 4):
+            self.create_post("Post %d." % day, 2020, 12, day=day)
+        self.create_post("New year post.", 2021, 1, day=1)
+        counts = list(MonthlyPostCount.objects.order_by('month').values_list('month', 'post_count'))
+        MonthlyPostCount.objects.all().delete()
+        archive.rebuild()
+        self.assertEqual(list(MonthlyPostCount.objects.order_by('month').values_list('month', 'post_count')), counts)
+        self.assertEqual(counts, [(datetime.date(2020, 12, 1), 3), (datetime.date(2021, 1, 1), 1)])
+
+    def test_archive_pages(self):
+        """
+        A month page lists only that month's posts, and the year page and
+        the index sidebar link to the months with posts.
+        """
+        self.create_post("Last of February.", 2021, 2, day=28)
+        self.create_post("First of March.", 2021, 3, day=1)
+        response = self.client.get(reverse('archive_month', args=(2021, 3)))
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'First of March.', content)
+        self.assertNotIn(b'Last of February.', content)
+
+        response = self.client.get(reverse('archive_year', args=(2021,)))
+        self.assertContains(response, reverse('archive_month', args=(2021, 2)))
+        self.assertContains(response, reverse('archive_month', args=(2021, 3)))
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, reverse('archive_month', args=(2021, 3)))
+
+        self.assertEqual(self.client.get(reverse('archive_year', args=(2019,))).status_code, 404)
+        self.assertEqual(self.client.get(reverse('archive_month', args=(2021, 13))).status_code, 404)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        for n in range(150):
+            Post.objects.create(title_text="Fish %d" % n, category_text="fish", body_text="", pub_date=timezone.now())
+        self.staff = User.objects.create_superuser(username="admin", password="password")
+
+    def test_profile_request(self):
+        """
+        A staff user's profiled request stores its SQL, template timings and
+        cProfile data, and still gets the whole page.
+        """
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('categories', args=("fish",)), {'profile': ''})
+        self.assertEqual(b''.join(response.streaming_content).count(b'list-group-item'), 150)
+        report = ProfileReport.objects.get(pk=response['X-Profile-Report'])
+        self.assertEqual((report.user, report.status_code), (self.staff, 200))
+        self.assertTrue(report.path.startswith(reverse('categories', args=("fish",))))
+        self.assertTrue(any('polls_post' in query['sql'] for query in report.queries))
+        self.assertEqual(report.query_count, len(report.queries))
+        self.assertIn('polls/categories.html', [template['template'] for template in report.templates])
+        self.assertIn('polls/_result_rows.html', [template['template'] for template in report.templates])
+        self.assertIn('categories', report.stats_text)
+        self.assertTrue(marshal.loads(report.stats_data))
+
+        response = self.client.get(reverse('index'), HTTP_X_PROFILE='1')
+        self.assertTrue(ProfileReport.objects.filter(pk=response['X-Profile-Report']).exists())
+
+    def test_not_triggered(self):
+        """
+        Requests without the trigger, or from users who aren't staff, are
+        not profiled and leave the template engine untouched.
+        """
+        render = Template._render
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.has_header('X-Profile-Report'))
+        self.client.logout()
+        User.objects.create_user(username="testUser", password="password")
+        self.client.login(username="testUser", password="password")
+        response = self.client.get(reverse('index'), {'profile': ''}, HTTP_X_PROFILE='1')
+        self.assertFalse(response.has_header('X-Profile-Report'))
+        self.assertFalse(ProfileReport.objects.exists())
+        self.assertIs(Template._render, render)
+
+    def test_find_duplicates(self):
+        """
+        Repeated statements are reported with how many runs repeated the
+        same parameters.
+        """
+        queries = [
+            {'sql': 'SELECT a WHERE id = %s', 'params': '(1,)'},
+            {'sql': 'SELECT a WHERE id = %s', 'params': '(2,)'},
+            {'sql': 'SELECT a WHERE id = %s', 'params': '(1,)'},
+            {'sql': 'SELECT b', 'params': '()'},
+        ]
+        self.assertEqual(profiling.find_duplicates(queries),
+                         [{'sql': 'SELECT a WHERE id = %s', 'count': 3, 'same_params': 1}])
+
+    def test_admin(self):
+        """
+        Reports are shown in the admin and their cProfile data downloaded.
+        """
+        self.client.force_login(self.staff)
+        report_id = self.client.get(reverse('index'), {'profile': ''})['X-Profile-Report']
+        response = self.client.get(reverse('admin:polls_profilereport_change', args=(report_id,)))
+        self.assertContains(response, 'polls_post')
+        self.assertContains(response, 'polls/index.html')
+        response = self.client.get(reverse('admin:polls_profilereport_download', args=(report_id,)))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="profile-%s.prof"' % report_id)
+        self.assertTrue(marshal.loads(response.content))
+
+
+class PageViewTests(TestCase):
+    def setUp(self):
+        # views recorded by other tests belong to posts that no longer exist
+        pageviews.counter.counts.clear()
+        pageviews.counter.known.clear()
+        self.interval, pageviews.counter.interval = pageviews.counter.interval, 3600
+        cache.clear()
+
+    def tearDown(self):
+        pageviews.counter.interval = self.interval
+
+    def test_views_are_buffered(self):
+        """
+        Viewing a post writes nothing; the buffered views are written in
+        one batched UPDATE on flush.
+        """
+        post = create_post(title_text="Popular post", days=-1)
+        with CaptureQueriesContext(connection) as queries:
+            for i in range(5):
+                self.client.get(reverse('show', args=(post.id,)))
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+        with CaptureQueriesContext(connection) as queries:
+            pageviews.counter.flush()
+        self.assertEqual([q['sql'].split()[0] for q in queries], ['INSERT', 'UPDATE'])
+        self.assertEqual(PostStats.objects.get(post=post).views, 5)
+        self.client.get(reverse('show', args=(post.id,)))
+        with CaptureQueriesContext(connection) as queries:
+            pageviews.counter.flush()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(PostStats.objects.get(post=post).views, 6)
+
+    def test_flush_in_chunks(self):
+        """
+        Views of many posts are written a chunk of posts per statement, and
+        the views of a chunk that fails to be written are kept.
+        """
+        size = pageviews.WRITE_CHUNK_SIZE
+        Post.objects.bulk_create([
+            Post(title_text="Post %d" % n, category_text="test", body_text="", pub_date=timezone.now())
+            for n in range(size * 2 + 50)
+        ])
+        posts = list(Post.objects.all())
+        for post in posts:
+            pageviews.counter.record(post.id)
+        pageviews.counter.record(posts[0].id)
+        with CaptureQueriesContext(connection) as queries:
+            pageviews.counter.flush()
+        self.assertEqual([q['sql'].split()[0] for q in queries], ['INSERT', 'UPDATE'] * 3)
+        self.assertEqual(PostStats.objects.aggregate(total=Sum('views'))['total'], len(posts) + 1)
+
+        for post in posts:
+            pageviews.counter.record(post.id)
+        write = pageviews.counter.write
+        written = []
+
+        def fail_second_chunk(counts):
+            if written:
+                raise DatabaseError("database is locked")
+            written.append(counts)
+            write(counts)
+
+        with mock.patch.object(pageviews.counter, 'write', fail_second_chunk):
+            with self.assertRaises(DatabaseError):
+                pageviews.counter.flush()
+        self.assertEqual(len(written[0]), size)
+        self.assertEqual(sum(pageviews.counter.counts.values()), len(posts) - size)
+        pageviews.counter.flush()
+        self.assertEqual(PostStats.objects.aggregate(total=Sum('views'))['total'], len(posts) * 2 + 1)
+
+    def test_popular_this_week(self):
+        """
+        Popular posts are ranked by views of the last seven days only.
+        """
+        old_favourite = create_post(title_text="Old favourite", days=-30)
+        trending = create_post(title_text="Trending post", days=-2)
+        today = timezone.localdate()
+        PostStats.objects.create(post=old_favourite, day=today - datetime.timedelta(days=10), views=100)
+        PostStats.objects.create(post=old_favourite, day=today, views=1)
+        PostStats.objects.create(post=trending, day=today - datetime.timedelta(days=1), views=10)
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['popular_posts'], [trending, old_favourite])
+        response = self.client.get(reverse('popular'))
+        self.assertContains(response, "10 views")
+
+
 class TestSelenium(TestCase):
     def setUp(self):
+        # selenium is heavy to import, so only the browser tests load it
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.by import By
+        self.By = By
         self.CHROMEDRIVER_PATH = 'chromedriver'
         self.WINDOW_SIZE = "1920,1080"
         self.chrome_options = Options()
@@ -333,9 +1233,9 @@ class TestSelenium(TestCase):
         # sprawdza wyświetlenie informacji w przypadku nieudanej próby logowania
         self.address = "http://localhost:8000/login"
         self.driver.get(self.address)
-        self.loginBox = self.driver.find_element(By.NAME, "username")
+        self.loginBox = self.driver.find_element(self.By.NAME, "username")
         self.loginBox.send_keys("wrongusername")
-        self.passwordBox = self.driver.find_element(By.NAME, "password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "password")
         self.passwordBox.send_keys("wrongpassword")
         self.form = self.driver.find_element_by_id("submitLogin")
         self.form.click()
@@ -347,9 +1247,9 @@ class TestSelenium(TestCase):
         # sprawdza wyświetlenie informacji w przypadku udanej próby logowania
         self.address = "http://localhost:8000/login"
         self.driver.get(self.address)
-        self.loginBox = self.driver.find_element(By.NAME, "username")
+        self.loginBox = self.driver.find_element(self.By.NAME, "username")
         self.loginBox.send_keys("testowyUser")
-        self.passwordBox = self.driver.find_element(By.NAME, "password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "password")
         self.passwordBox.send_keys("qwerty")
         self.form = self.driver.find_element_by_id("submitLogin")
         self.form.click()
@@ -361,13 +1261,13 @@ class TestSelenium(TestCase):
         # sprawdza czy formularz zadziała w przypadku nieprawidłowego formatu email
         self.address = "http://localhost:8000/register"
         self.driver.get(self.address)
-        self.loginBox = self.driver.find_element(By.NAME, "username")
+        self.loginBox = self.driver.find_element(self.By.NAME, "username")
         self.loginBox.send_keys("wrongusername")
-        self.passwordBox = self.driver.find_element(By.NAME, "email")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "email")
         self.passwordBox.send_keys("wrongemail")
-        self.passwordBox = self.driver.find_element(By.NAME, "password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "password")
         self.passwordBox.send_keys("wrongpassword")
-        self.passwordBox = self.driver.find_element(By.NAME, "confirmation_password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "confirmation_password")
         self.passwordBox.send_keys("wrongpassword")
         self.form = self.driver.find_element_by_id("submitRegister")
         self.form.click()
@@ -378,13 +1278,13 @@ class TestSelenium(TestCase):
         # sprawdza czy formularz zadziała w przypadku nieprawidłowego formatu email
         self.address = "http://localhost:8000/register"
         self.driver.get(self.address)
-        self.loginBox = self.driver.find_element(By.NAME, "username")
+        self.loginBox = self.driver.find_element(self.By.NAME, "username")
         self.loginBox.send_keys("wrongusername")
-        self.passwordBox = self.driver.find_element(By.NAME, "email")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "email")
         self.passwordBox.send_keys("wrong@ema.il")
-        self.passwordBox = self.driver.find_element(By.NAME, "password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "password")
         self.passwordBox.send_keys("wrongpassword")
-        self.passwordBox = self.driver.find_element(By.NAME, "confirmation_password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "confirmation_password")
         self.passwordBox.send_keys("differentpassword")
         self.form = self.driver.find_element_by_id("submitRegister")
         self.form.click()
@@ -396,13 +1296,13 @@ class TestSelenium(TestCase):
         # sprawdza czy formularz zadziała w przypadku prawidłowych danych
         self.address = "http://localhost:8000/register"
         self.driver.get(self.address)
-        self.loginBox = self.driver.find_element(By.NAME, "username")
+        self.loginBox = self.driver.find_element(self.By.NAME, "username")
         self.loginBox.send_keys("correctusername")
-        self.passwordBox = self.driver.find_element(By.NAME, "email")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "email")
         self.passwordBox.send_keys("corr@ct.mail")
-        self.passwordBox = self.driver.find_element(By.NAME, "password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "password")
         self.passwordBox.send_keys("correctpassword")
-        self.passwordBox = self.driver.find_element(By.NAME, "confirmation_password")
+        self.passwordBox = self.driver.find_element(self.By.NAME, "confirmation_password")
         self.passwordBox.send_keys("correctpassword")
         self.form = self.driver.find_element_by_id("submitRegister")
         self.form.click()
@@ -1,13 +1,27 @@
+from django.contrib.sitemaps.views import sitemap
 from django.urls import path
 
 from . import views
+from .feeds import (CategoryAtomFeed, CategoryFeed, LatestPostsAtomFeed, LatestPostsFeed,
+                    cached_by_posts_version, sitemaps)
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('photos', views.photos, name='photos'),
+    path('popular', views.popular, name='popular'),
     path('info', views.info, name='info'),
     path('search/<str:title>', views.search, name='search'),
+    path('suggest', views.suggest, name='suggest'),
     path('categories/<str:category>', views.categories, name='categories'),
+    path('categories/<str:category>/rss', cached_by_posts_version(CategoryFeed()), name='category_rss'),
+    path('categories/<str:category>/atom', cached_by_posts_version(CategoryAtomFeed()), name='category_atom'),
+    path('tags/<str:slugs>', views.tags, name='tags'),
+    path('archive/<int:year>', views.archive_year, name='archive_year'),
+    path('archive/<int:year>/<int:month>', views.archive_month, name='archive_month'),
+    path('feed/rss', cached_by_posts_version(LatestPostsFeed()), name='rss'),
+    path('feed/atom', cached_by_posts_version(LatestPostsAtomFeed()), name='atom'),
+    path('sitemap.xml', cached_by_posts_version(sitemap), {'sitemaps': sitemaps}, name='sitemap'),
+    path('users/<str:username>', views.profile, name='profile'),
     path('register', views.register, name='register'),
     path('user/register', views.storeUser, name='storeUser'),
     path('login', views.login, name='login'),
@@ -1,17 +1,28 @@
-from django.http import HttpResponse
+import datetime
+
+from django.http import HttpResponse, JsonResponse
 from django.template import loader
 from django.shortcuts import get_object_or_404, render, redirect
 from django.http import Http404
 from django.views import generic
+from django.views.static import serve
+from django.utils.cache import patch_cache_control
+from django.urls import NoReverseMatch, reverse
 from django.utils import timezone
 from django.contrib import messages
 from django.contrib.auth import authenticate
 from django.contrib.auth import login as django_login
 from django.contrib.auth.models import User
 from django.contrib.auth import logout as django_logout
-# import numpy as np
 
-from .models import Post, Comment
+from .models import Post, Comment, RelatedPost, UserStats
+from .storage import is_hashed_name
+from . import suggest as suggestions
+from . import archive
+from . import pageviews
+from . import profiles
+from . import tags as tagging
+from .streaming import CHUNK_SIZE, render_listing
 
 def index(request):
     latest_post_list = Post.objects.filter(pub_date__lte=timezone.now()).order_by('-pub_date')[:5]
@@ -25,7 +36,13 @@ def index(request):
     
     categories = sorted(categories.items(), key=lambda item: item[1], reverse=True)
     categories = categories[0:10]
-    context = {'latest_post_list': latest_post_list, 'categories': categories}
+    context = {
+        'latest_post_list': latest_post_list,
+        'categories': categories,
+        'popular_posts': pageviews.popular_posts(),
+        'tag_cloud': tagging.tag_cloud(),
+        'archive_months': archive.sidebar(),
+    }
 
     return render(request, 'polls/index.html', context)
     
@@ -41,26 +58,116 @@ class ShowView(generic.DetailView):
         """
         return Post.objects.filter(pub_date__lte=timezone.now())
 
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        pageviews.counter.record(self.object.pk)
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        links = RelatedPost.objects.filter(
+            post=self.object, related__pub_date__lte=timezone.now()
+        ).select_related('related').order_by('rank')
+        context['related_posts'] = [link.related for link in links]
+        context['tags'] = list(self.object.tags.order_by('name'))
+        context['comments'] = list(
+            self.object.comment_set.filter(status=Comment.APPROVED).select_related('user').order_by('id'))
+        return context
+
+
+def popular(request):
+    context = {'results': pageviews.popular_posts(limit=50)}
+    return render(request, 'polls/popular.html', context)
 
 def photos(request):
-    photos = []
-    for post in Post.objects.all():
-        photos.append(post.image_file.url)
-    context = {'photos': photos}
-    return render(request, 'polls/photos.html', context)
+    posts = Post.objects.only('image_file', 'image_width', 'image_height', 'image_color', 'image_placeholder')
+    photos = ({
+        'url': post.image_file.url,
+        'width': post.image_width,
+        'height': post.image_height,
+        'color': post.image_color,
+        'placeholder': post.image_placeholder,
+    } for post in posts.iterator(chunk_size=CHUNK_SIZE))
+    return render_listing(request, 'polls/photos.html', 'polls/_photo_rows.html', photos)
+
+def media(request, path, document_root=None):
+    """
+    Serves uploaded media; content-addressed files never change, so they
+    may be cached forever.
+    """
+    response = serve(request, path, document_root=document_root)
+    if is_hashed_name(path):
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    return response
 
 def info(request):
     return render(request, 'polls/info.html')
 
 def search(request, title):
-    results = Post.objects.filter(title_text__icontains=title)
-    context = {'results': results}
-    return render(request, 'polls/search.html', context)
+    results = Post.objects.filter(title_text__icontains=title).only('id', 'title_text')
+    return render_listing(request, 'polls/search.html', 'polls/_result_rows.html', results)
+
+def suggest(request):
+    results = []
+    for kind, label, post_id in suggestions.get_index().search(request.GET.get('q', '')):
+        if kind == 'post':
+            url = reverse('show', args=(post_id,))
+        else:
+            try:
+                url = reverse('categories', args=(label,))
+            except NoReverseMatch:
+                # categories with a slash have no page to link to
+                continue
+        results.append({'kind': kind, 'label': label, 'url': url})
+    return JsonResponse({'suggestions': results})
 
 def categories(request, category):
-    results = Post.objects.filter(category_text__icontains=category)
-    context = {'results': results}
-    return render(request, 'polls/categories.html', context)
+    results = Post.objects.filter(category_text__icontains=category).only('id', 'title_text')
+    return render_listing(request, 'polls/categories.html', 'polls/_result_rows.html', results)
+
+def tags(request, slugs):
+    selected, results = tagging.posts_with_all_tags(slugs.split('+'))
+    if selected is None:
+        raise Http404("No such tag")
+    results = results.only('id', 'title_text')
+    context = {'tags': selected}
+    return render_listing(request, 'polls/tags.html', 'polls/_result_rows.html', results, context)
+
+def profile(request, username):
+    profile_user = get_object_or_404(User, username=username)
+    try:
+        before = int(request.GET['before'])
+    except (KeyError, ValueError):
+        before = None
+    if before is not None and not 0 < before <= profiles.MAX_COMMENT_ID:
+        # beyond any stored id: start from the newest, or below the first: nothing is older
+        before = None if before > 0 else 1
+    comments, next_before = profiles.user_comments(profile_user, before)
+    context = {
+        'profile_user': profile_user,
+        'stats': UserStats.objects.filter(user=profile_user).first() or UserStats(user=profile_user),
+        'comments': comments,
+        'next_before': next_before,
+    }
+    return render(request, 'polls/profile.html', context)
+
+def archive_year(request, year):
+    months = [(month, count) for month, count in archive.histogram() if month.year == year]
+    if not months:
+        raise Http404("No posts in this year")
+    context = {'year': year, 'months': archive.with_bars(months), 'years': archive.years()}
+    return render(request, 'polls/archive_year.html', context)
+
+def archive_month(request, year, month):
+    try:
+        start, end = archive.month_range(datetime.date(year, month, 1))
+    except (ValueError, OverflowError):
+        raise Http404("No such month")
+    results = Post.objects.filter(
+        pub_date__gte=start, pub_date__lt=end, pub_date__lte=timezone.now()
+    ).order_by('-pub_date').only('id', 'title_text')
+    context = {'month': start}
+    return render_listing(request, 'polls/archive_month.html', 'polls/_result_rows.html', results, context)
 
 def register(request):
     return render(request, 'polls/register.html')
@@ -103,6 +210,7 @@ def storeComment(request, post_id):
         messages.error(request, 'Commenting is restricted for authenticated users')
         return redirect('show', pk=post_id)
     else:
-        comment = Comment(body_text=request.POST['body'], name=request.user.id, post = get_object_or_404(Post, pk=post_id))
+        comment = Comment(body_text=request.POST['body'], user=request.user, post = get_object_or_404(Post, pk=post_id))
         comment.save()
+        messages.success(request, 'Your comment is awaiting moderation')
         return redirect('show', pk=post_id)    
\ No newline at end of file